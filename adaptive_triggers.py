@@ -0,0 +1,160 @@
+"""
+Adaptive stopping on derived quantities instead of per bin tally triggers.
+
+The Flux trigger in first_run_model.py needs every bin (group x element) under
+5 % relative error, so the worst thermal or fast group of an edge element
+decides when the run stops. This driver runs the model batch by batch with
+openmc.lib and, every trigger_batch_interval active batches, checks the
+quantities we actually use:
+
+  'power_weighted'  power weighted mean relative error of element power
+  'peak_power'      relative error of the peak element power
+  'collapsed_flux'  worst relative error of the group collapsed element flux
+
+The run stops as soon as every one is under its threshold, or at
+max_batches.
+"""
+
+import json
+import os
+
+import numpy as np
+import openmc
+import openmc.lib
+
+import geometry_definitions as gd
+
+
+default_criteria = {'power_weighted': 0.01, 'peak_power': 0.02,
+                    'collapsed_flux': 0.05}
+
+
+def collapse(mean, std_dev, n_first):
+    """
+    sums the bins of a tally result over everything but the first filter,
+    bins assumed independent
+    """
+    mean = mean.reshape(n_first, -1)
+    std_dev = std_dev.reshape(n_first, -1)
+    return mean.sum(axis=1), np.sqrt((std_dev**2).sum(axis=1))
+
+
+def derived_errors(heating, flux, n_elements):
+    """
+    heating, flux: openmc.lib tallies of the per element kappa-fission and
+    fuel flux, returns the relative error of each derived quantity
+    """
+    power, power_std = collapse(heating.mean, heating.std_dev, n_elements)
+    element_flux, flux_std = collapse(flux.mean, flux.std_dev, n_elements)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        power_rel_err = np.where(power > 0, power_std/power, 0)
+        flux_rel_err = np.where(element_flux > 0, flux_std/element_flux, 0)
+
+    peak = power.argmax()
+    return {'power_weighted': float((power*power_rel_err).sum()/power.sum()),
+            'peak_power': float(power_rel_err[peak]),
+            'collapsed_flux': float(flux_rel_err.max())}
+
+
+def run_adaptive(model, directory='adaptive_run', criteria=None,
+                 interval=None, max_batches=100, threads=None,
+                 heating='Heating', flux='Fuel Flux'):
+    """
+    runs model with openmc.lib, stopping once every derived quantity meets
+    its criterion (checked every interval active batches, by default
+    model.settings.trigger_batch_interval) or at max_batches
+
+    returns the statepoint path and the history of the checks
+    """
+    criteria = criteria or default_criteria
+    inactive = model.settings.inactive
+    if interval is None:
+        interval = model.settings.trigger_batch_interval or 1
+    if max_batches <= inactive:
+        raise ValueError(f'max_batches ({max_batches}) leaves no active batches '
+                         f'after {inactive} inactive')
+
+    # the derived quantities replace the per bin triggers
+    model.settings.batches = max_batches
+    model.settings.trigger_active = False
+    for tally in model.tallies:
+        tally.triggers = []
+
+    tally_ids = {tally.name: tally.id for tally in model.tallies}
+    fuel_cell = gd.get_cell(model.geometry, 'fuel_element')
+    model.geometry.determine_paths()
+    n_elements = fuel_cell.num_instances
+
+    os.makedirs(directory, exist_ok=True)
+    model.export_to_model_xml(directory)
+
+    history = []
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        args = ['-s', str(threads)] if threads else None
+        with openmc.lib.run_in_memory(args=args):
+            openmc.lib.simulation_init()
+            for _ in openmc.lib.iter_batches():
+                batch = openmc.lib.current_batch()
+                n_active = batch - inactive
+                if n_active < 2 or n_active % interval:
+                    continue
+
+                errors = derived_errors(openmc.lib.tallies[tally_ids[heating]],
+                                        openmc.lib.tallies[tally_ids[flux]],
+                                        n_elements)
+                met = all(errors[k] < criteria[k] for k in criteria)
+                history.append({'batch': batch, 'errors': errors, 'met': met})
+                print(f'batch {batch}: ' + ', '.join(
+                    f'{k} {errors[k]:.4f}/{criteria[k]}' for k in criteria))
+                if met:
+                    break
+
+            statepoint = f'statepoint.{openmc.lib.current_batch()}.h5'
+            openmc.lib.statepoint_write(statepoint)
+            openmc.lib.simulation_finalize()
+    finally:
+        os.chdir(cwd)
+
+    return os.path.join(directory, statepoint), history
+
+
+def main():
+    core_height = 89
+    clocking = 180 - 70.277
+    fuel_name = 'graphite_fuel_435U_30C'
+
+    model = gd.get_model(core_height, clocking, fuel_name)
+    model.settings.particles = 1_000_000
+    model.settings.inactive = 20
+    model.settings.temperature = {'default': 2500}
+    model.settings.trigger_batch_interval = 10
+
+    fuel_cell_filter = openmc.DistribcellFilter(gd.get_cell(model.geometry, 'fuel_element'))
+    fuel = gd.get_material(model.materials, fuel_name)
+
+    heating_tally = openmc.Tally(name='Heating')
+    heating_tally.filters = [fuel_cell_filter]
+    heating_tally.scores = ['kappa-fission']
+
+    # first_run_model.py's 'Fuel Flux', 'Flux' there has no material filter
+    flux_tally = openmc.Tally(name='Fuel Flux')
+    flux_tally.filters = [fuel_cell_filter, openmc.MaterialFilter([fuel]),
+                          openmc.EnergyFilter(gd.energy_bins),
+                          openmc.ParticleFilter('neutron')]
+    flux_tally.scores = ['flux']
+    model.tallies = [heating_tally, flux_tally]
+
+    statepoint, history = run_adaptive(model)
+    status = 'met' if history and history[-1]['met'] else 'NOT met'
+    print(f'stopped at batch {history[-1]["batch"] if history else None} '
+          f'(criteria {status}), {statepoint}')
+
+    with open('adaptive_triggers.json', 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
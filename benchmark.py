@@ -0,0 +1,237 @@
+"""
+Particle rate benchmark suite for the SNRE model and its building blocks.
+
+Runs short, fixed jobs for each case (single fuel element, tie tube,
+beryllium element, reflector, full core) at several thread counts, and
+records particles/sec for the inactive and active batches plus the memory
+high-water mark of the openmc process. Results are appended to a JSON
+history so geometry or settings changes can be compared to a baseline.
+Elements without fissile material are run in fixed source mode.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+
+
+def element_model(universe):
+    """
+    single element universe in a 10 cm tall reflective hex prism
+    """
+    flat_to_flat = 1.905
+    edge_length = 0.5*flat_to_flat/np.cos(np.deg2rad(30))
+
+    prism = openmc.model.HexagonalPrism(orientation='x', edge_length=edge_length,
+                                        boundary_type='reflective')
+    bottom = openmc.ZPlane(z0=-5, boundary_type='reflective')
+    top = openmc.ZPlane(z0=5, boundary_type='reflective')
+
+    cell = openmc.Cell(region=-prism & +bottom & -top, fill=universe)
+    return openmc.Model(geometry=openmc.Geometry([cell]))
+
+
+def reflector_model(universe):
+    """
+    reflector universe in its annulus, 10 cm tall reflective slab, with a
+    uniform source in the annulus
+    """
+    inner_radius = 33.6550
+    outer_radius = inner_radius + 14.7
+
+    inner = openmc.ZCylinder(r=inner_radius, boundary_type='vacuum')
+    outer = openmc.ZCylinder(r=outer_radius, boundary_type='vacuum')
+    bottom = openmc.ZPlane(z0=-5, boundary_type='reflective')
+    top = openmc.ZPlane(z0=5, boundary_type='reflective')
+
+    cell = openmc.Cell(region=+inner & -outer & +bottom & -top, fill=universe)
+    model = openmc.Model(geometry=openmc.Geometry([cell]))
+    model.settings.source = openmc.IndependentSource(
+        space=openmc.stats.CylindricalIndependent(
+            r=openmc.stats.Uniform(inner_radius, outer_radius),
+            phi=openmc.stats.Uniform(0, 2*np.pi),
+            z=openmc.stats.Uniform(-5, 5)))
+    return model
+
+
+def get_cases(height=89, clocking=180-70.277,
+              graphite_fuel='graphite_fuel_435U_30C'):
+    """
+    returns {name: (build, eigenvalue)} for every benchmark case, build()
+    returns the case's model so only the requested cases are built
+    """
+    materials = gd.get_model_builder().materials
+
+    def material(name):
+        return gd.get_material(materials, name)
+
+    def fuel_assembly():
+        return element_model(gd.fuel_assembly(material('Hydrogen STP'),
+                                              material('zirconium_carbide'),
+                                              material(graphite_fuel)))
+
+    def tie_tube():
+        hydrogen = material('Hydrogen STP')
+        return element_model(gd.tie_tube(hydrogen, hydrogen, material('inconel-718'),
+                                         material('zirconium_hydride_II'),
+                                         material('zirconium_carbide'),
+                                         material('zirconium_carbide_insulator'),
+                                         material('graphite_carbon')))
+
+    def beryllium_assembly():
+        return element_model(gd.beryllium_assembly(material('Beryllium'),
+                                                   material('zirconium_carbide')))
+
+    def reflector():
+        return reflector_model(gd.reflector(material('copper_boron'),
+                                            material('Beryllium'),
+                                            material('inconel-718'),
+                                            clocking=clocking))
+
+    def full_core():
+        return gd.get_model(height, clocking, graphite_fuel)
+
+    def with_materials(build):
+        def build_case():
+            model = build()
+            model.materials = openmc.Materials(model.geometry.get_all_materials().values())
+            return model
+        return build_case
+
+    return {'fuel_assembly': (with_materials(fuel_assembly), True),
+            'tie_tube': (with_materials(tie_tube), False),
+            'beryllium_assembly': (with_materials(beryllium_assembly), False),
+            'reflector': (with_materials(reflector), False),
+            'full_core': (with_materials(full_core), True)}
+
+
+def measure(model, directory, threads=None, particles=10_000, batches=15,
+            inactive=5, eigenvalue=True):
+    """
+    runs model in directory and returns particles/sec for the inactive and
+    active batches, k-eff (eigenvalue only) and the openmc memory high-water
+    mark in MB. Models without temperature settings run at 2500 K
+    """
+    settings = model.settings
+    settings.particles = particles
+    settings.batches = batches
+    if not settings.temperature:
+        settings.temperature = {'default': 2500}
+    if eigenvalue:
+        settings.run_mode = 'eigenvalue'
+        settings.inactive = inactive
+    else:
+        settings.run_mode = 'fixed source'
+        settings.inactive = 0
+        inactive = 0
+
+    os.makedirs(directory, exist_ok=True)
+    model.export_to_model_xml(directory)
+
+    # wait4 gives the resource usage of this openmc process alone
+    command = ['openmc'] + (['-s', str(threads)] if threads else [])
+    process = subprocess.Popen(command, cwd=directory,
+                               stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f'openmc failed in {directory}')
+
+    statepoint = os.path.join(directory, f'statepoint.{batches}.h5')
+    with openmc.StatePoint(statepoint) as sp:
+        runtime = sp.runtime
+        keff = sp.keff if eigenvalue else None
+
+    result = {'active_pps': particles*(batches - inactive)/runtime['active batches'],
+              'inactive_pps': (particles*inactive/runtime['inactive batches']
+                               if inactive else None),
+              'maxrss_mb': usage.ru_maxrss/1024}
+    if keff is not None:
+        result['keff'] = [keff.nominal_value, keff.std_dev]
+
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(entry, baseline):
+    """
+    prints the particle rate of entry relative to baseline for every case
+    and thread count they share
+    """
+    old = {(r['case'], r['threads']): r for r in baseline['results']}
+    for r in entry['results']:
+        b = old.get((r['case'], r['threads']))
+        if b is None:
+            continue
+        print(f"{r['case']:>20} {r['threads']:>3} threads: active pps "
+              f"x{r['active_pps']/b['active_pps']:.3f}, memory "
+              f"x{r['maxrss_mb']/b['maxrss_mb']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--label', default='', help='name for this entry')
+    parser.add_argument('--cases', nargs='*', default=None)
+    parser.add_argument('--threads', nargs='*', type=int,
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--particles', type=int, default=10_000)
+    parser.add_argument('--batches', type=int, default=15)
+    parser.add_argument('--inactive', type=int, default=5)
+    parser.add_argument('--history', default='benchmark_history.json')
+    parser.add_argument('--baseline', default=None,
+                        help='label of the history entry to compare against')
+    args = parser.parse_args()
+
+    cases = get_cases()
+    names = args.cases or list(cases)
+
+    entry = {'label': args.label,
+             'date': datetime.datetime.now().isoformat(timespec='seconds'),
+             'commit': git_commit(),
+             'particles': args.particles, 'batches': args.batches,
+             'inactive': args.inactive, 'results': []}
+
+    for name in names:
+        build, eigenvalue = cases[name]
+        model = build()
+        for threads in args.threads:
+            result = measure(model, os.path.join('benchmark', f'{name}_{threads}'),
+                             threads, args.particles, args.batches,
+                             args.inactive, eigenvalue)
+            result.update(case=name, threads=threads)
+            entry['results'].append(result)
+            print(f"{name:>20} {threads:>3} threads: active "
+                  f"{result['active_pps']:10.1f} pps, memory "
+                  f"{result['maxrss_mb']:8.1f} MB")
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+
+    if args.baseline is not None:
+        baselines = [e for e in history if e['label'] == args.baseline]
+        if baselines:
+            compare(entry, baselines[-1])
+        else:
+            print(f'no history entry labelled {args.baseline}')
+
+    history.append(entry)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
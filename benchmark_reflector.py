@@ -0,0 +1,35 @@
+"""
+Compares the tracking rate of the 'union' (12-fold unioned regions) and
+'sectors' (12 drum sector universes) reflector on the same get_model()
+parameters with short eigenvalue runs.
+"""
+
+import benchmark
+import geometry_definitions as gd
+
+
+def main():
+    height = 89
+    clocking = 180 - 70.277
+    particles = 20_000
+    batches = 15
+    inactive = 5
+
+    results = {}
+    for mode in ('union', 'sectors'):
+        model = gd.get_model(height, clocking, reflector_mode=mode)
+        results[mode] = benchmark.measure(model, f'benchmark_reflector_{mode}',
+                                          particles=particles, batches=batches,
+                                          inactive=inactive)
+
+    for mode, result in results.items():
+        print(f"{mode:>8}: inactive {result['inactive_pps']:10.1f} pps, "
+              f"active {result['active_pps']:10.1f} pps, "
+              f"k-eff {result['keff'][0]:.5f} +/- {result['keff'][1]:.5f}")
+
+    speedup = results['sectors']['active_pps']/results['union']['active_pps']
+    print(f'active tracking rate speedup (sectors/union): {speedup:.2f}')
+
+
+if __name__ == '__main__':
+    main()
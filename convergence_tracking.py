@@ -0,0 +1,146 @@
+"""
+Batch-over-statepoints trend analysis for a run.
+
+Summarizes every statepoint.*.h5 in a run directory (k-eff, Shannon entropy
+from the entropy_mesh, and tally relative errors) in parallel worker
+processes, caching each summary by file mtime so only new or changed files
+are re-read. Reports per batch trends and the earliest batch where the tally
+triggers would already have been met, to decide when to stop paying for
+more batches.
+"""
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+
+import post_processing as pp
+
+
+# the tallies first_run_model.py puts triggers on, the only ones the
+# trigger threshold applies to
+triggered_tallies = ('Heating', 'Flux')
+
+
+def summarize_statepoint(path, tallies=triggered_tallies):
+    """
+    returns a json friendly summary of one statepoint
+    """
+    with h5py.File(path, 'r') as f:
+        summary = {'batch': int(f['current_batch'][()]),
+                   'n_inactive': int(f['n_inactive'][()]),
+                   'keff': [float(k) for k in f['k_combined'][()]],
+                   'entropy': ([float(h) for h in f['entropy'][()]]
+                               if 'entropy' in f else []),
+                   'max_rel_err': {}}
+
+        for name in tallies:
+            try:
+                reduced = pp.reduce_tally(f, name)
+            except KeyError:
+                continue
+            summary['max_rel_err'][name] = float(reduced['overall_max_rel_err'])
+
+    return summary
+
+
+def scan_run(directory, cache_file='convergence_cache.json', workers=None):
+    """
+    returns summaries of every statepoint in directory sorted by batch,
+    files whose mtime matches the cache are not re-read
+    """
+    cache_path = os.path.join(directory, cache_file)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    paths = glob.glob(os.path.join(directory, 'statepoint.*.h5'))
+    stale = [p for p in paths
+             if cache.get(os.path.basename(p), {}).get('mtime')
+             != os.path.getmtime(p)]
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, summary in zip(stale, pool.map(summarize_statepoint, stale)):
+                summary['mtime'] = os.path.getmtime(path)
+                cache[os.path.basename(path)] = summary
+
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+
+    summaries = [cache[os.path.basename(p)] for p in paths]
+    return sorted(summaries, key=lambda s: s['batch']), len(stale)
+
+
+def entropy_converged_batch(entropy, n_sigma=3):
+    """
+    returns the first batch (1-based) after which the Shannon entropy stays
+    within n_sigma standard deviations of its mean over the last half of the
+    run, or None if there is no entropy
+    """
+    entropy = np.asarray(entropy)
+    if entropy.size < 4:
+        return None
+
+    tail = entropy[entropy.size//2:]
+    inside = np.abs(entropy - tail.mean()) <= n_sigma*max(tail.std(), 1e-12)
+
+    # last batch outside the band, converged from the one after
+    outside = np.flatnonzero(~inside)
+    return int(outside[-1]) + 2 if outside.size else 1
+
+
+def report(summaries, threshold=0.05):
+    """
+    prints per batch k-eff and triggered tally relative errors, where the
+    entropy converged, and the first batch where every triggered tally met
+    threshold
+    """
+    names = sorted({n for s in summaries for n in s['max_rel_err']
+                    if n in triggered_tallies})
+    print(f"{'batch':>6} {'k-eff':>16} " + ' '.join(f'{n[:18]:>18}' for n in names))
+    for s in summaries:
+        keff = f"{s['keff'][0]:.5f}+/-{s['keff'][1]:.5f}"
+        errors = ' '.join(f"{s['max_rel_err'].get(n, np.nan):18.4f}" for n in names)
+        print(f"{s['batch']:>6} {keff:>16} {errors}")
+
+    if not summaries:
+        return
+
+    last = summaries[-1]
+    converged = entropy_converged_batch(last['entropy'])
+    if converged is not None:
+        status = 'ok' if converged <= last['n_inactive'] else 'TOO FEW inactive batches'
+        print(f"entropy converged by batch {converged}, "
+              f"{last['n_inactive']} inactive batches ({status})")
+
+    for s in summaries:
+        errors = [s['max_rel_err'][n] for n in names if n in s['max_rel_err']]
+        if errors and max(errors) < threshold:
+            print(f"every tally under {threshold} relative error at batch "
+                  f"{s['batch']}, later batches were not needed")
+            break
+    else:
+        print(f'tallies have not reached {threshold} relative error yet')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', nargs='?', default='.')
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='relative error the tally triggers use')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    summaries, n_read = scan_run(args.directory, workers=args.workers)
+    print(f'{len(summaries)} statepoints, {n_read} read')
+    report(summaries, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Automated search for the critical control drum angle.
+
+Several drum angles are evaluated at once in a process pool, k(angle) is fit
+with a weighted linear regression over the current bracket, and the bracket
+is narrowed around the root. Particles per batch grow as (initial width /
+width)^2 so the k-eff noise stays small compared to the change in k across
+the bracket, the first iterations are cheap and only the last ones are not.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+
+
+def evaluate_keff(height, angle, particles, batches, inactive, directory,
+                  threads=None, model_kwargs=None):
+    """
+    runs get_model(height, angle) in directory, returns (k-eff, std dev)
+    """
+    model = gd.get_model(height, angle, **(model_kwargs or {}))
+
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': 2500}
+
+    os.makedirs(directory, exist_ok=True)
+    statepoint = model.run(cwd=directory, threads=threads, output=False)
+
+    with openmc.StatePoint(statepoint) as sp:
+        keff = sp.keff
+
+    return keff.nominal_value, keff.std_dev
+
+
+def fit_root(angles, keffs, sigmas, target):
+    """
+    weighted linear fit of k(angle), returns the angle where k = target and
+    its standard deviation from the fit covariance
+    """
+    angles = np.asarray(angles)
+    weights = 1/np.asarray(sigmas)
+
+    (slope, intercept), cov = np.polyfit(angles, keffs, 1, w=weights,
+                                         cov='unscaled')
+    root = (target - intercept)/slope
+
+    # d(root)/d(slope), d(root)/d(intercept)
+    jacobian = np.array([-root/slope, -1/slope])
+    root_std = np.sqrt(jacobian @ cov @ jacobian)
+
+    return root, root_std, slope
+
+
+def critical_search(height, target=1.0, bracket=(0, 180), n_parallel=4,
+                    tolerance=0.5, base_particles=10_000,
+                    max_particles=1_000_000, batches=40, inactive=15,
+                    max_iterations=8, run_directory='critical_search',
+                    model_kwargs=None):
+    """
+    returns a dict with the critical drum angle (degrees), its standard
+    deviation, and every evaluated point
+
+    height: core height passed to get_model
+    target: k-eff to search for
+    bracket: (low, high) drum angles to start from
+    n_parallel: number of angles evaluated at once, one process each
+    tolerance: stop once the angle standard deviation is below this
+    """
+    low, high = bracket
+    initial_width = high - low
+    threads = max(1, (os.cpu_count() or 1)//n_parallel)
+
+    points = []
+    histories = 0
+    result = None
+
+    with ProcessPoolExecutor(max_workers=n_parallel) as pool:
+        for iteration in range(max_iterations):
+            width = high - low
+            particles = int(min(max_particles,
+                                base_particles*(initial_width/width)**2))
+            angles = np.linspace(low, high, n_parallel)
+
+            futures = [pool.submit(evaluate_keff, height, angle, particles,
+                                   batches, inactive,
+                                   os.path.join(run_directory,
+                                                f'iter{iteration}_{i}'),
+                                   threads, model_kwargs)
+                       for i, angle in enumerate(angles)]
+
+            for angle, future in zip(angles, futures):
+                keff, sigma = future.result()
+                points.append({'angle': float(angle), 'keff': keff,
+                               'std_dev': sigma, 'particles': particles,
+                               'iteration': iteration})
+            histories += n_parallel*particles*batches
+
+            # fit over the points in the current bracket, earlier (cheaper)
+            # points are weighted down by their larger std dev
+            in_bracket = [p for p in points if low <= p['angle'] <= high]
+            root, root_std, slope = fit_root([p['angle'] for p in in_bracket],
+                                             [p['keff'] for p in in_bracket],
+                                             [p['std_dev'] for p in in_bracket],
+                                             target)
+
+            print(f'iteration {iteration}: {particles} particles, bracket '
+                  f'({low:.2f}, {high:.2f}), critical angle '
+                  f'{root:.3f} +/- {root_std:.3f}')
+
+            result = {'angle': float(root), 'std_dev': float(root_std),
+                      'dk_dangle': float(slope), 'target': target,
+                      'height': height, 'iterations': iteration + 1,
+                      'histories': histories, 'converged': False,
+                      'points': points}
+
+            if root_std < tolerance and low <= root <= high:
+                result['converged'] = True
+                break
+
+            # narrow the bracket around the root, but keep it wide enough
+            # to cover the fit uncertainty
+            half_width = max(3*root_std, tolerance, width/8)
+            half_width = min(half_width, width/4)
+            center = np.clip(root, bracket[0], bracket[1])
+            low = max(bracket[0], center - half_width)
+            high = min(bracket[1], center + half_width)
+
+    return result
+
+
+def main():
+    core_height = 89
+    fuel_name = 'graphite_fuel_435U_30C'
+
+    result = critical_search(core_height,
+                             model_kwargs={'graphite_fuel': fuel_name})
+
+    status = 'converged' if result['converged'] else 'NOT converged'
+    print(f"critical drum angle {result['angle']:.3f} +/- "
+          f"{result['std_dev']:.3f} degrees ({status}, "
+          f"{result['histories']:.3e} histories)")
+
+    with open('critical_search.json', 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Depletion with the fuel elements grouped into burnup bins.
+
+Depleting each fuel element instance on its own means ~564 depletable
+materials, so the elements are grouped: the fuel rings are split into
+radial zones and the elements of every zone into equal count power bins
+from the kappa-fission distribcell 'Heating' tally (a statepoint of
+first_run_model.py, or a short run). Each bin gets one depletable copy of
+the fuel, set as a distributed fill on the fuel_element cell
+(get_model(..., fuel_loading=...)), with the volume of all its elements.
+
+The depletion chain is reduced to the nuclides within a few steps of the
+fuel nuclides and the xenon and samarium chains, which is all a burn of
+minutes to an hour builds up. --scan runs the depletion for several bin
+counts in separate processes and reports the runtime and memory high-water
+mark of each.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import h5py
+import numpy as np
+import openmc
+import openmc.deplete
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+# minutes, a full power burn of an hour
+default_timesteps = [1, 4, 10, 15, 30]
+
+# kept in the reduced chain whatever the search depth
+poison_chains = ('I135', 'Xe135', 'Pm149', 'Sm149')
+
+
+def element_fuel_volume(height):
+    """
+    fuel volume of one element in cm3
+    """
+    return gd.element_fuel_area()*height
+
+
+def element_powers(height, clocking, graphite_fuel, directory='depletion_power',
+                   particles=100_000, batches=50, inactive=20):
+    """
+    short run with the per element kappa-fission tally, returns the
+    statepoint path
+    """
+    model = gd.get_model(height, clocking, graphite_fuel)
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': 2500}
+
+    heating_tally = openmc.Tally(name='Heating')
+    heating_tally.filters = [openmc.DistribcellFilter(
+        gd.get_cell(model.geometry, 'fuel_element'))]
+    heating_tally.scores = ['kappa-fission']
+    model.tallies = [heating_tally]
+
+    os.makedirs(directory, exist_ok=True)
+    return model.run(cwd=directory)
+
+
+def burnup_bins(index, power, ring_zones, power_bins):
+    """
+    returns the bin of every fuel element instance: the rings split into
+    ring_zones radial zones, each zone's elements sorted by power into
+    power_bins equal count bins. Empty bins are dropped
+    """
+    rings = np.unique(index['ring'])
+    zone_of = {ring: zone for zone, members in enumerate(np.array_split(rings, ring_zones))
+               for ring in members}
+    zones = np.array([zone_of[ring] for ring in index['ring']])
+
+    bins = np.zeros(len(power), dtype=int)
+    for zone in range(ring_zones):
+        members = np.flatnonzero(zones == zone)
+        order = members[np.argsort(power[members])]
+        for n, chunk in enumerate(np.array_split(order, power_bins)):
+            bins[chunk] = zone*power_bins + n
+
+    return np.unique(bins, return_inverse=True)[1]
+
+
+def bin_materials(fuel, bins, element_volume):
+    """
+    returns one depletable copy of fuel per bin, its volume that of all the
+    elements in the bin
+    """
+    materials = []
+    for n in range(bins.max() + 1):
+        material = fuel.clone()
+        material.name = f'{fuel.name} bin {n}'
+        material.depletable = True
+        material.volume = element_volume*np.count_nonzero(bins == n)
+        materials.append(material)
+    return materials
+
+
+def reduce_chain(chain_file, fuel, level=2, output='chain_reduced.xml'):
+    """
+    writes the part of chain_file within level transmutation/decay/fission
+    steps of the fuel nuclides and poison_chains, returns its path
+    """
+    chain = openmc.deplete.Chain.from_xml(chain_file)
+    initial = [nuclide for nuclide in fuel.get_nuclides() + list(poison_chains)
+               if nuclide in chain.nuclide_dict]
+    reduced = chain.reduce(initial, level)
+    reduced.export_to_xml(output)
+
+    print(f'chain reduced from {len(chain.nuclides)} to {len(reduced.nuclides)} nuclides')
+    return output
+
+
+def deplete(height, clocking, graphite_fuel, power, ring_zones, power_bins,
+            chain_file, timesteps=default_timesteps, thermal_power=pp.thermal_power,
+            directory='depletion', particles=100_000, batches=50, inactive=20,
+            level=2):
+    """
+    power: per fuel element instance power (any normalization) used to bin
+    the elements. Runs the depletion in directory with timesteps in minutes
+
+    returns the results file, the bin of every element and the bin materials
+    """
+    builder = gd.get_model_builder()
+    index = builder.distribcell_index(graphite_fuel)
+    if len(power) != len(index['ring']):
+        raise ValueError(f'{len(power)} element powers for '
+                         f'{len(index["ring"])} fuel element instances')
+
+    bins = burnup_bins(index, np.asarray(power), ring_zones, power_bins)
+    fuel = gd.get_material(builder.materials, graphite_fuel)
+    materials = bin_materials(fuel, bins, element_fuel_volume(height))
+
+    model = gd.get_model(height, clocking, graphite_fuel,
+                         fuel_loading=[materials[n] for n in bins])
+    model.materials.extend(materials)
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': 2500}
+
+    os.makedirs(directory, exist_ok=True)
+    chain = reduce_chain(chain_file, fuel, level,
+                         os.path.join(directory, 'chain_reduced.xml'))
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        operator = openmc.deplete.CoupledOperator(
+            model, os.path.abspath(os.path.basename(chain)),
+            normalization_mode='fission-q')
+        integrator = openmc.deplete.PredictorIntegrator(
+            operator, timesteps, thermal_power, timestep_units='min')
+        integrator.integrate()
+    finally:
+        os.chdir(cwd)
+
+    return os.path.join(directory, 'depletion_results.h5'), bins, materials
+
+
+def summarize(results_file, bins, materials):
+    """
+    returns k-eff against time and per bin the element count, U235 burned
+    fraction and end of burn Xe135 density
+    """
+    results = openmc.deplete.Results(results_file)
+    minutes, keff = results.get_keff(time_units='min')
+
+    summary = {'minutes': minutes.tolist(), 'keff': keff.tolist(), 'bins': []}
+    for n, material in enumerate(materials):
+        _, u235 = results.get_atoms(material, 'U235')
+        _, xe135 = results.get_atoms(material, 'Xe135', nuc_units='atom/b-cm')
+        summary['bins'].append({'elements': int(np.count_nonzero(bins == n)),
+                                'u235_burned': float(1 - u235[-1]/u235[0]),
+                                'xe135': float(xe135[-1])})
+    return summary
+
+
+def scan(configurations, extra_args, output='depletion_scan.json'):
+    """
+    runs this script for each (ring_zones, power_bins) in its own process,
+    returns the bins, wall time and memory high-water mark of each
+    """
+    rows = []
+    for ring_zones, power_bins in configurations:
+        directory = f'depletion_{ring_zones}x{power_bins}'
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--ring-zones', str(ring_zones), '--power-bins', str(power_bins),
+                   '--directory', directory] + extra_args
+
+        # wait4 gives the resource usage of this run alone
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f'depletion failed in {directory}')
+
+        with open(os.path.join(directory, 'depletion_summary.json')) as f:
+            summary = json.load(f)
+        rows.append({'ring_zones': ring_zones, 'power_bins': power_bins,
+                     'bins': len(summary['bins']), 'wall_s': wall,
+                     'maxrss_mb': usage.ru_maxrss/1024,
+                     'final_keff': summary['keff'][-1]})
+
+    with open(output, 'w') as f:
+        json.dump(rows, f, indent=1)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--statepoint', default=None,
+                        help="statepoint with the per element 'Heating' tally, "
+                             'otherwise a short run makes one')
+    parser.add_argument('--ring-zones', type=int, default=3)
+    parser.add_argument('--power-bins', type=int, default=3)
+    parser.add_argument('--chain', default=openmc.config.get('chain_file'))
+    parser.add_argument('--level', type=int, default=2,
+                        help='depth of the reduced chain')
+    parser.add_argument('--timesteps', type=float, nargs='*', default=default_timesteps,
+                        help='minutes')
+    parser.add_argument('--particles', type=int, default=100_000)
+    parser.add_argument('--directory', default='depletion')
+    parser.add_argument('--scan', nargs='*', default=None, metavar='RxP',
+                        help='ring zones x power bins to compare, e.g. 1x1 3x3 6x4')
+    args = parser.parse_args()
+
+    if args.chain is None:
+        parser.error('no depletion chain, set --chain or openmc.config["chain_file"]')
+
+    statepoint = args.statepoint or element_powers(args.height, args.clocking, args.fuel)
+
+    if args.scan is not None:
+        configurations = [tuple(int(n) for n in c.split('x')) for c in args.scan]
+        extra_args = ['--height', str(args.height), '--clocking', str(args.clocking),
+                      '--fuel', args.fuel, '--statepoint', os.path.abspath(statepoint),
+                      '--chain', os.path.abspath(args.chain), '--level', str(args.level),
+                      '--particles', str(args.particles), '--timesteps'] + \
+                     [str(t) for t in args.timesteps]
+        print(f"{'zones':>6} {'power':>6} {'bins':>5} {'wall s':>9} {'MB':>9} {'k-eff':>8}")
+        for row in scan(configurations, extra_args):
+            print(f"{row['ring_zones']:6d} {row['power_bins']:6d} {row['bins']:5d} "
+                  f"{row['wall_s']:9.1f} {row['maxrss_mb']:9.1f} {row['final_keff'][0]:8.5f}")
+        return
+
+    with h5py.File(statepoint, 'r') as f:
+        power = pp.reduce_tally(f, 'Heating')['mean']
+
+    start = time.perf_counter()
+    results_file, bins, materials = deplete(
+        args.height, args.clocking, args.fuel, power, args.ring_zones,
+        args.power_bins, args.chain, args.timesteps, directory=args.directory,
+        particles=args.particles, level=args.level)
+    summary = summarize(results_file, bins, materials)
+    summary['wall_s'] = time.perf_counter() - start
+
+    print(f"{len(materials)} burnup bins, k-eff {summary['keff'][0][0]:.5f} -> "
+          f"{summary['keff'][-1][0]:.5f} over {summary['minutes'][-1]:.0f} min "
+          f"in {summary['wall_s']:.0f} s")
+    for n, row in enumerate(summary['bins']):
+        print(f"bin {n}: {row['elements']} elements, {100*row['u235_burned']:.4f} % "
+              f"U235 burned, Xe135 {row['xe135']:.3e} atom/b-cm")
+
+    with open(os.path.join(args.directory, 'depletion_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Independent seed ensembles and statepoint merging.
+
+Instead of one big MPI job, the same get_model() model is run N times with
+different random number seeds, as local worker processes or as separate
+batch jobs (one job script per member). The statepoints are then merged:
+tally sums, sums of squares and realization counts are added, which gives
+the pooled mean and standard deviation over every active batch of every
+member, and k-eff is the inverse variance weighted mean of the members.
+The merged statepoint keeps the statepoint layout, with the summary.h5 of
+the first member next to it, so openmc.StatePoint and the post processing
+notebook read it like any other run. Its n_particles is the per batch total
+of all the members and its runtimes the sums of the member runtimes, so
+particles*batches/runtime is the mean rate of one member; k_generation and
+entropy are those of the first member.
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+
+
+job_template = """#!/bin/bash
+cd {directory}
+openmc {threads}
+"""
+
+
+def prepare(model, directory='ensemble', n_members=8, base_seed=1, threads=None):
+    """
+    writes the model with seed base_seed + i to directory/member_i and a
+    job script for each member, returns the member directories
+    """
+    members = []
+    for i in range(n_members):
+        member = os.path.abspath(os.path.join(directory, f'member_{i}'))
+        os.makedirs(member, exist_ok=True)
+
+        model.settings.seed = base_seed + i
+        model.export_to_model_xml(member)
+
+        with open(os.path.join(member, 'job.sh'), 'w') as f:
+            f.write(job_template.format(directory=member,
+                                        threads=f'-s {threads}' if threads else ''))
+        members.append(member)
+
+    return members
+
+
+def run_local(members, workers=None, threads=None):
+    """
+    runs every member with its own openmc process, workers at a time, each
+    with threads OpenMP threads. By default one member at a time uses every
+    core, or as many members as fit run with threads cores each
+    """
+    cores = os.cpu_count() or 1
+    if workers is None:
+        workers = max(1, cores//threads) if threads else 1
+    threads = threads or max(1, cores//workers)
+
+    def run_member(member):
+        command = ['openmc', '-s', str(threads)]
+        subprocess.run(command, cwd=member, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run_member, members))
+
+
+def last_statepoint(member):
+    paths = glob.glob(os.path.join(member, 'statepoint.*.h5'))
+    if not paths:
+        raise FileNotFoundError(f'no statepoint in {member}')
+    return max(paths, key=lambda p: int(p.split('.')[-2]))
+
+
+def merge(statepoints, output):
+    """
+    merges the statepoints of independent runs of the same model into
+    output, returns the merged k-eff [mean, std dev]
+    """
+    shutil.copyfile(statepoints[0], output)
+
+    keffs = []
+    seeds = []
+    for path in statepoints:
+        with h5py.File(path, 'r') as f:
+            keffs.append(f['k_combined'][()])
+            if 'seed' in f:
+                seeds.append(int(f['seed'][()]))
+    if len(set(seeds)) != len(seeds):
+        raise ValueError('ensemble members must use different seeds')
+
+    with h5py.File(output, 'r+') as out:
+        tallies = out['tallies']
+        for path in statepoints[1:]:
+            with h5py.File(path, 'r') as f:
+                for tally_id in tallies.attrs.get('ids', []):
+                    group = tallies[f'tally {tally_id}']
+                    other = f['tallies'][f'tally {tally_id}']
+                    if group['results'].shape != other['results'].shape:
+                        raise ValueError(f'tally {tally_id} differs in {path}')
+
+                    group['results'][...] += other['results'][()]
+                    group['n_realizations'][...] += other['n_realizations'][()]
+
+                out['global_tallies'][...] += f['global_tallies'][()]
+                out['n_realizations'][...] += f['n_realizations'][()]
+                out['n_particles'][...] += f['n_particles'][()]
+                for name in out['runtime']:
+                    out['runtime'][name][...] += f['runtime'][name][()]
+
+        # inverse variance weighted k-eff of the members
+        keffs = np.array(keffs)
+        weights = 1/keffs[:, 1]**2
+        keff = [np.sum(weights*keffs[:, 0])/weights.sum(), 1/np.sqrt(weights.sum())]
+        out['k_combined'][...] = keff
+
+    summary = os.path.join(os.path.dirname(statepoints[0]), 'summary.h5')
+    if os.path.exists(summary):
+        shutil.copyfile(summary, os.path.join(os.path.dirname(output), 'summary.h5'))
+
+    return keff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', default=None,
+                        help='model.xml to run (e.g. from first_run_model.py), '
+                             'otherwise get_model() without tallies')
+    parser.add_argument('--members', type=int, default=8)
+    parser.add_argument('--directory', default='ensemble')
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--particles', type=int, default=1_250_000,
+                        help='particles per batch of each member')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='members run at once locally, by default cores/threads '
+                             'or 1')
+    parser.add_argument('--jobs', action='store_true',
+                        help='only write the members and job scripts')
+    parser.add_argument('--merge-only', action='store_true',
+                        help='merge the statepoints of finished members')
+    args = parser.parse_args()
+
+    if args.merge_only:
+        members = sorted(glob.glob(os.path.join(args.directory, 'member_*')))
+    else:
+        if args.model is not None:
+            model = openmc.Model.from_model_xml(args.model)
+        else:
+            model = gd.get_model(args.height, args.clocking, args.fuel)
+            model.settings.batches = 50
+            model.settings.inactive = 20
+            model.settings.temperature = {'default': 2500}
+        model.settings.particles = args.particles
+
+        members = prepare(model, args.directory, args.members, threads=args.threads)
+        if args.jobs:
+            print(f"submit {os.path.join(args.directory, 'member_*', 'job.sh')}, "
+                  f'then rerun with --merge-only')
+            return
+        run_local(members, args.workers, args.threads)
+
+    statepoints = [last_statepoint(member) for member in members]
+    merged = os.path.join(args.directory, 'merged')
+    os.makedirs(merged, exist_ok=True)
+    output = os.path.join(merged, os.path.basename(statepoints[0]))
+    keff = merge(statepoints, output)
+
+    print(f'merged {len(statepoints)} members into {output}: k-eff '
+          f'{keff[0]:.5f} +/- {keff[1]:.5f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Checks that the 'lattice' fuel assembly mode is a drop in replacement for
+the 'union' mode: same distribcell indexing of the fuel elements in the full
+core, and the same fuel volume per element.
+Only uses the python api, so it runs without the openmc executable.
+"""
+
+import re
+import sys
+
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+
+
+def lattice_indices(geometry):
+    """
+    returns the core lattice index of every fuel_element instance, in
+    distribcell order
+    """
+    geometry.determine_paths()
+    fuel_cell = gd.get_cell(geometry, 'fuel_element')
+
+    # the first lattice in each path is the core lattice
+    return [re.search(r'l\d+\(([^)]*)\)', path).group(1)
+            for path in fuel_cell.paths]
+
+
+def fuel_area(universe, fuel, n_points=50_000, seed=1):
+    """
+    returns the fuel area of a single element universe from point sampling,
+    and the material found at each sampled point
+    """
+    flat_to_flat = gd.element_flat_to_flat
+    edge_length = 0.5*flat_to_flat/np.cos(np.deg2rad(30))
+
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-edge_length, edge_length, n_points)
+    y = rng.uniform(-flat_to_flat/2, flat_to_flat/2, n_points)
+
+    fills = []
+    for point in zip(x, y, np.zeros(n_points)):
+        path = universe.find(point)
+        fills.append(path[-1].fill if path else None)
+
+    is_fuel = np.array([fill is fuel for fill in fills])
+    box_area = 2*edge_length*flat_to_flat
+
+    return box_area*is_fuel.mean(), fills
+
+
+def main():
+    height = 89
+    clocking = 180 - 70.277
+    fuel_name = 'graphite_fuel_435U_30C'
+    passed = True
+
+    # distribcell indexing over the full core
+    indices = {mode: lattice_indices(gd.get_model(height, clocking, fuel_name,
+                                                  fuel_mode=mode).geometry)
+               for mode in ('union', 'lattice')}
+
+    print(f"fuel element instances: union {len(indices['union'])}, "
+          f"lattice {len(indices['lattice'])}")
+    if indices['union'] != indices['lattice']:
+        print('FAIL: distribcell instances map to different lattice positions')
+        passed = False
+
+    # fuel volume of a single element
+    materials = openmc.Materials.from_xml('materials.xml')
+    hydrogen = gd.get_material(materials, 'Hydrogen STP')
+    ZrC = gd.get_material(materials, 'zirconium_carbide')
+    fuel = gd.get_material(materials, fuel_name)
+
+    union_area, union_fills = fuel_area(
+        gd.fuel_assembly(hydrogen, ZrC, fuel, mode='union'), fuel)
+    lattice_area, lattice_fills = fuel_area(
+        gd.fuel_assembly(hydrogen, ZrC, fuel, mode='lattice'), fuel)
+    mismatches = sum(a is not b for a, b in zip(union_fills, lattice_fills))
+
+    exact_area = gd.element_fuel_area()
+    print(f'fuel volume per element (cm3): union {union_area*height:.4f}, '
+          f'lattice {lattice_area*height:.4f}, analytic {exact_area*height:.4f}')
+    print(f'sampled points with different materials: {mismatches}')
+    if mismatches > 0:
+        print('FAIL: fuel element modes fill space with different materials')
+        passed = False
+
+    print('PASS' if passed else 'FAIL')
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,25 +4,166 @@ fuel elements/tie tubes, and that will fill these with the appropriate materials
 The main function will plot both with sample materials
 """
 
+import copy
+import os
+import re
+import time
+
 import openmc
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+# ENDF/B-VIII.0 broad group library (56 energy groups), used by the flux
+# tallies and the multigroup libraries
+energy_bins = [20000000, 6434000, 4304000, 3000000, 1850000, 1500000, 1200000, 861100, 750000,
+                600000, 470000, 330000, 270000, 200000, 50000, 20000, 17000,
+                3740, 2250, 191.5, 187.7, 117.5, 116, 105, 101.2,
+                67.5, 65, 37.13, 36, 21.75, 21.2, 20.5, 7, 6.875,
+                6.5, 6.25, 5, 1.13, 1.08, 1.01, 0.625, 0.45,
+                0.375, 0.35, 0.325, 0.25, 0.2, 0.15, 0.1, 0.08,
+                0.06, 0.05, 0.04, 0.0253, 0.01, 0.004][::-1]
+
+# fuel element dimensions in cm, Schnitzler et al. 2012
+element_flat_to_flat = 1.905
+element_cladding_thickness = 0.005
+channel_pitch = 0.4089
+channel_diameter = 0.2565
+channel_cladding_thickness = 0.01
+
+def element_fuel_area():
+    """
+    fuel cross section of one element in cm2: the hexagon inside the
+    element cladding minus the 19 cladded channels
+    """
+    flat_to_flat_fuel = element_flat_to_flat - element_cladding_thickness
+    outer_channel_radius = (channel_diameter + channel_cladding_thickness)/2
+    return np.sqrt(3)/2*flat_to_flat_fuel**2 - 19*np.pi*outer_channel_radius**2
+
 def get_material(materials, name):
     """
-    searches materials object for a matching name and returns it
+    searches materials object for a matching name and returns it, raises
+    KeyError if there is none
     """
     for material in materials:
         if material.name == name:
             return material
-    
-    print(f'MATERIAL {name} NOT FOUND !!!')
+
+    raise KeyError(f'material {name} not found')
+
+def get_cell(geometry, name):
+    """
+    searches geometry for a cell with a matching name and returns it, raises
+    KeyError if there is none
+    """
+    for cell in geometry.get_all_cells().values():
+        if cell.name == name:
+            return cell
+
+    raise KeyError(f'cell {name} not found')
+
+def instance_indices(geometry, name):
+    """
+    returns the lattice and lattice index holding each distribcell instance
+    of the named cell, in instance order, for the first lattice on the path
+    """
+    geometry.determine_paths()
+    cell = get_cell(geometry, name)
+    return path_indices(cell.paths, geometry.get_all_lattices())
+
+def path_indices(paths, lattices):
+    """
+    returns (lattice, index) of the first lattice on each distribcell path,
+    or None for paths that don't go through a lattice
+    """
+    indices = []
+    for path in paths:
+        match = re.search(r'l(\d+)\(([^)]*)\)', path)
+        if match is None:
+            indices.append(None)
+            continue
+        lattice_id, index = match.groups()
+        indices.append((lattices[int(lattice_id)],
+                        tuple(int(i) for i in re.findall(r'-?\d+', index))))
+
+    return indices
+
+def ring_positions(n_rings):
+    """
+    returns {(x, alpha): (ring, position)} for an orientation 'y' HexLattice
+    with n_rings rings, ring 0 is the outermost like HexLattice.universes and
+    position 0 is at the top of the ring going clockwise
+    """
+    mapping = {(0, 0): (n_rings - 1, 0)}
+
+    # clockwise from the top corner (0, r), r steps along each side
+    steps = [(1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1), (1, 0)]
+    for r in range(1, n_rings):
+        i, j = 0, r
+        position = 0
+        for di, dj in steps:
+            for _ in range(r):
+                mapping[(i, j)] = (n_rings - 1 - r, position)
+                i, j = i + di, j + dj
+                position += 1
+
+    return mapping
+
+def distribcell_index(geometry, cell_name='fuel_element'):
+    """
+    returns a dict of arrays, one entry per distribcell instance: 'ring' and
+    'position' in the core lattice universes, 'layer' (0 at the bottom, 0
+    for an unstacked lattice), the element center 'x', 'y', 'z' and the
+    element 'type' (name of the lattice universe)
+
+    resolving the paths is slow, build it once per core (see
+    ModelBuilder.distribcell_index) and save it with save_distribcell_index
+    """
+    indices = instance_indices(geometry, cell_name)
+    lattice = indices[0][0]
+    rings = ring_positions(lattice.num_rings)
+
+    layout = {key: [] for key in ('ring', 'position', 'layer', 'x', 'y', 'z', 'type')}
+    for lattice, idx in indices:
+        ring, position = rings[idx[:2]]
+        local = lattice.get_local_position((0., 0., 0.), idx)
+        layout['ring'].append(ring)
+        layout['position'].append(position)
+        layout['layer'].append(idx[2] if len(idx) == 3 else 0)
+        layout['x'].append(-local[0])
+        layout['y'].append(-local[1])
+        layout['z'].append(-local[2] if len(local) == 3 else 0.)
+
+    # every instance should sit on a lattice position holding its element
+    universes = lattice.universes[0] if lattice.num_axial else lattice.universes
+    cell = get_cell(geometry, cell_name)
+    for ring, position in zip(layout['ring'], layout['position']):
+        universe = universes[ring][position]
+        if cell.id not in universe.get_all_cells():
+            raise ValueError(f'lattice position ({ring}, {position}) does not '
+                             f'hold {cell_name}')
+        layout['type'].append(universe.name)
+
+    return {key: np.array(value) for key, value in layout.items()}
+
+def save_distribcell_index(index, path):
+    """
+    writes a distribcell index to an .npz file
+    """
+    np.savez_compressed(path, **index)
+
+def load_distribcell_index(path):
+    """
+    reads a distribcell index written by save_distribcell_index, results
+    of the cell's distribcell tally map onto it with index[key][bins]
+    """
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
 
 def boreholes(origin_list, propellent, clad):
     
-    propellant_channel_diameter = 0.2565
-    propellant_channel_inner_cladding_thickness = 0.01
+    propellant_channel_diameter = channel_diameter
+    propellant_channel_inner_cladding_thickness = channel_cladding_thickness
 
     cells = []
     
@@ -53,16 +194,43 @@ def boreholes(origin_list, propellent, clad):
 
     return borehole, cladding, fuel_region
 
+def propellant_channel(propellent, clad, fuel):
+    """
+    returns a universe with a single propellant channel at the origin,
+    surrounded by an infinite fuel cell, for use in the channel lattice
+    """
+
+    propellant_channel_diameter = channel_diameter
+    propellant_channel_inner_cladding_thickness = channel_cladding_thickness
+
+    inner_cyl = openmc.ZCylinder(r=propellant_channel_diameter/2)
+    outer_cyl = openmc.ZCylinder(r=(propellant_channel_diameter+
+                                    propellant_channel_inner_cladding_thickness)/
+                                    2)
+
+    borehole = openmc.Cell(region=-inner_cyl, fill=propellent)
+    cladding = openmc.Cell(region=-outer_cyl & +inner_cyl, fill=clad)
+    fuel_cell = openmc.Cell(region=+outer_cyl, fill=fuel)
 
+    return openmc.Universe(cells=[borehole, cladding, fuel_cell])
 
-def fuel_assembly(propellent, clad, fuel):
+
+def fuel_assembly(propellent, clad, fuel, mode='union'):
+    """
+    mode: 'union' builds the 19 channels as one unioned borehole cell,
+    'lattice' builds them as a hex lattice of single channel universes so a
+    particle only checks the surfaces of its local channel
+
+    in both modes the cell named 'fuel_element' has exactly one instance per
+    element, so distribcell tallies on it are indexed the same way
+    """
     # build a single element
     # Measurements from Schnitzler et al. 2012
 
-    pitch = 0.4089
+    pitch = channel_pitch
     y_pitch = pitch*np.cos(np.deg2rad(30))
-    assembly_cladding_thickness = 0.005
-    flat_to_flat = 1.905
+    assembly_cladding_thickness = element_cladding_thickness
+    flat_to_flat = element_flat_to_flat
     flat_to_flat_fuel = flat_to_flat - assembly_cladding_thickness
     assembly_edge_length = 0.5*flat_to_flat/np.cos(np.deg2rad(30))
     fuel_edge_length = 0.5*flat_to_flat_fuel/np.cos(np.deg2rad(30))
@@ -72,6 +240,26 @@ def fuel_assembly(propellent, clad, fuel):
     fuel_assembly_cladding = openmc.model.HexagonalPrism(
         orientation='x', edge_length=assembly_edge_length)
 
+    clad_region = -fuel_assembly_cladding & + fuel_assembly
+    clad_cell = openmc.Cell(region=clad_region, fill=clad)
+
+    if mode == 'lattice':
+        # 3 rings of channels (1 + 6 + 12), rows of channels run along x
+        channel = propellant_channel(propellent, clad, fuel)
+        channel_lattice = openmc.HexLattice()
+        channel_lattice.orientation = 'x'
+        channel_lattice.pitch = (pitch,)
+        channel_lattice.center = (0.0, 0.0)
+        channel_lattice.universes = [[channel]*12, [channel]*6, [channel]]
+        channel_lattice.outer = openmc.Universe(cells=[openmc.Cell(fill=fuel)])
+
+        fuel_cell = openmc.Cell(name='fuel_element', region=-fuel_assembly,
+                                fill=channel_lattice)
+
+        return openmc.Universe(name='fuel_assembly', cells=[fuel_cell, clad_cell])
+    elif mode != 'union':
+        raise ValueError(f'unknown fuel assembly mode {mode}')
+
     # Borehole Cells
     origin_list = [(0,0,0),
         (-pitch*2,0,0),
@@ -96,12 +284,11 @@ def fuel_assembly(propellent, clad, fuel):
     borehole_cell, channel_clad_cell, fuel_region = boreholes(origin_list, propellent, clad)
 
     fuel_region = -fuel_assembly & fuel_region
-    clad_region = -fuel_assembly_cladding & + fuel_assembly
 
-    fuel_cell = openmc.Cell(region=fuel_region, fill=fuel)
-    clad_cell = openmc.Cell(region=clad_region, fill=clad)
+    fuel_cell = openmc.Cell(name='fuel_element', region=fuel_region, fill=fuel)
 
-    fuel_assembly_univ = openmc.Universe(cells = [borehole_cell,
+    fuel_assembly_univ = openmc.Universe(name='fuel_assembly',
+                                         cells = [borehole_cell,
                                                   channel_clad_cell, 
                                                   fuel_cell,
                                                   clad_cell])
@@ -157,20 +344,158 @@ def tie_tube(hydrogen_inner, hydrogen_outer, inconel, ZrH, ZrC, ZrC_insulator, g
         region=+tie_tube_assembly & -tie_tube_assembly_cladding, fill=ZrC)
 
     # Full Tie Tube Assembly
-    tie_tube_assembly_universe = openmc.Universe(cells=[inner_hydrogen_cell, inner_tie_tube_cell, first_gap_cell,
+    tie_tube_assembly_universe = openmc.Universe(name='tie_tube',
+                                                 cells=[inner_hydrogen_cell, inner_tie_tube_cell, first_gap_cell,
                                                         moderator_tube_cell, outer_hydrogen_cell, outer_tie_tube_cell,
                                                         third_gap_cell, insulator_cell, fourth_gap_cell,
                                                         tie_tube_assembly_cell, tie_tube_assembly_cladding_cell])
     
     return tie_tube_assembly_universe
 
+def drum_clockings(clocking):
+    """
+    returns an array of 12 drum clocking angles from one angle or a list of 12
+    """
+    clockings = np.atleast_1d(clocking).astype(float)
+    if clockings.size == 1:
+        clockings = np.full(12, clockings[0])
+    elif clockings.size != 12:
+        raise ValueError('clocking must be a single angle or one per drum (12)')
+
+    return clockings
+
+def control_drum(poison_material, reflector_material, bolt_material,
+                 drum_center, clocking, sector_bolt_centers,
+                 drum_radius = 12.7/2, poison_thickness = 0.65,
+                 poison_angle_span = 120,
+                 sector_bolt_diameter = 1.057,
+                 drum_bolt_diameter = 0.478):
+    """
+    returns a universe with one control drum at drum_center, the sector tie
+    bolts at sector_bolt_centers, and reflector everywhere else.
+    clocking is the angle of the poison in degrees, 0 faces the core center.
+    The universe is in reflector coordinates, so it is meant to fill a cell
+    bounded to the drum's sector.
+    """
+
+    x0, y0 = drum_center
+    drum_angle = np.rad2deg(np.arctan2(y0, x0))
+    poison_angle = drum_angle - 180 + clocking
+
+    angle1 = np.deg2rad(poison_angle-poison_angle_span/2)
+    angle2 = np.deg2rad(poison_angle+poison_angle_span/2)
+
+    poison_plane_1 = openmc.Plane.from_points((x0, y0, 0), (x0, y0, 1),
+                                              (x0+np.cos(angle1),
+                                               y0+np.sin(angle1), 0))
+    poison_plane_2 = openmc.Plane.from_points((x0, y0, 0), (x0, y0, 1),
+                                              (x0+np.cos(angle2),
+                                               y0+np.sin(angle2), 0))
+
+    drum_od = openmc.ZCylinder(x0, y0, drum_radius)
+    poison_id = openmc.ZCylinder(x0, y0, drum_radius-poison_thickness)
+    drum_tie_bolt = openmc.ZCylinder(x0, y0, drum_bolt_diameter/2)
+    sector_tie_bolts = [openmc.ZCylinder(x, y, sector_bolt_diameter/2)
+                        for x, y in sector_bolt_centers]
+
+    poison_region = +poison_id & -drum_od & +poison_plane_1 & -poison_plane_2
+    drum_region = -drum_od & +drum_tie_bolt & ~poison_region
+
+    sector_bolt_region = -sector_tie_bolts[0]
+    reflector_region = +drum_od
+    for bolt in sector_tie_bolts[1:]:
+        sector_bolt_region = sector_bolt_region | -bolt
+    for bolt in sector_tie_bolts:
+        reflector_region = reflector_region & +bolt
+
+    poison_cell = openmc.Cell(region=poison_region, fill=poison_material)
+    drum_cell = openmc.Cell(region=drum_region, fill=reflector_material)
+    drum_bolt_cell = openmc.Cell(region=-drum_tie_bolt, fill=bolt_material)
+    sector_bolt_cell = openmc.Cell(region=sector_bolt_region, fill=bolt_material)
+    reflector_cell = openmc.Cell(region=reflector_region, fill=reflector_material)
+
+    drum_universe = openmc.Universe(cells=[reflector_cell,
+                                           drum_cell,
+                                           poison_cell,
+                                           drum_bolt_cell,
+                                           sector_bolt_cell])
+
+    return drum_universe
+
 def reflector(poison_material, reflector_material, bolt_material,
                            reflector_id = 67.31,reflector_thickness = 14.7,
                            drum_radius = 12.7/2, poison_thickness = 0.65,
                            poison_angle_span = 120, 
                            sector_bolt_diameter = 1.057, 
                            drum_bolt_diameter = 0.478,
-                           clocking = 0):
+                           clocking = 0, mode = 'sectors'):
+    """
+    12 control drums in the outer reflector, drum k sits at 180 - 30*k degrees
+
+    clocking: poison angle in degrees (0 faces the core), either one angle
+    for every drum or a list of 12, one per drum
+    mode: 'sectors' builds 12 bounded 30 degree sector cells, each filled with
+    its own control_drum universe, 'union' builds the drums, poisons and
+    bolts as 12-fold unioned regions (single clocking only)
+    """
+
+    reflector_od = reflector_id + 2*reflector_thickness
+    drum_center_radius = (reflector_id+reflector_od)/4
+    bolt_radii = (reflector_id/2+1/3*reflector_thickness,
+                  reflector_id/2+2/3*reflector_thickness)
+
+    clockings = drum_clockings(clocking)
+
+    reflector_inner_surface = openmc.ZCylinder(r=reflector_id/2)
+    reflector_outer_surface = openmc.ZCylinder(r=reflector_od/2)
+
+    if mode == 'sectors':
+        # sector boundaries sit halfway between drums, at 15 + 30*j degrees,
+        # 6 planes through the origin cover all 12 boundaries
+        boundary_planes = [openmc.Plane.from_points((0,0,0),(0,0,1),
+                                                    (np.cos(a), np.sin(a), 0))
+                           for a in np.deg2rad(np.arange(15, 180, 30))]
+
+        def sector_sides(angle):
+            # (counterclockwise, clockwise) half spaces of the boundary at angle
+            m = int(round((angle-15)/30)) % 12
+            plane = boundary_planes[m % 6]
+            return (+plane, -plane) if m < 6 else (-plane, +plane)
+
+        sector_cells = []
+        for k in range(12):
+            drum_angle = 180 - 30*k
+            drum_center = (drum_center_radius*np.cos(np.deg2rad(drum_angle)),
+                           drum_center_radius*np.sin(np.deg2rad(drum_angle)))
+
+            # tie bolts on both sector boundaries, each sector keeps its half
+            bolt_centers = [(r*np.cos(np.deg2rad(drum_angle+side)),
+                             r*np.sin(np.deg2rad(drum_angle+side)))
+                            for side in (-15, 15) for r in bolt_radii]
+
+            drum_universe = control_drum(poison_material, reflector_material,
+                                         bolt_material, drum_center,
+                                         clockings[k], bolt_centers,
+                                         drum_radius, poison_thickness,
+                                         poison_angle_span,
+                                         sector_bolt_diameter,
+                                         drum_bolt_diameter)
+
+            sector_region = (+reflector_inner_surface &
+                             -reflector_outer_surface &
+                             sector_sides(drum_angle-15)[0] &
+                             sector_sides(drum_angle+15)[1])
+
+            sector_cells.append(openmc.Cell(region=sector_region,
+                                            fill=drum_universe))
+
+        return openmc.Universe(cells=sector_cells)
+    elif mode != 'union':
+        raise ValueError(f'unknown reflector mode {mode}')
+
+    if not np.all(clockings == clockings[0]):
+        raise ValueError("per drum clocking needs mode='sectors'")
+    clocking = clockings[0]
 
     def get_poison_planes(clocking_angle, poison_angle):
         #return 2 planes +/- poison_angle/2 from the clocking angle
@@ -193,7 +518,7 @@ def reflector(poison_material, reflector_material, bolt_material,
         # Turn 1 drum/poison region into 12
         full_region = region
 
-        angles = np.linspace(30, 360, 11)
+        angles = np.arange(30, 360, 30)
 
         for angle in angles:
             full_region = (full_region | 
@@ -202,7 +527,6 @@ def reflector(poison_material, reflector_material, bolt_material,
 
         return full_region
 
-    reflector_od = reflector_id + 2*reflector_thickness
     drum_od = openmc.ZCylinder(r=drum_radius)
     poison_id = openmc.ZCylinder(r=drum_od.r-poison_thickness)
     poison_plane_1, poison_plane_2 = get_poison_planes(clocking,
@@ -244,9 +568,6 @@ def reflector(poison_material, reflector_material, bolt_material,
     sector_bolt_cell = openmc.Cell(region=sector_bolt_region, fill=bolt_material)
     drum_bolt_cell = openmc.Cell(region=drum_bolt_region, fill = bolt_material)
 
-    reflector_inner_surface = openmc.ZCylinder(r=reflector_id/2)
-    reflector_outer_surface = openmc.ZCylinder(r=reflector_od/2)
-
     reflector_region = (-reflector_outer_surface & 
                         +reflector_inner_surface & 
                         ~drum_region & ~poison_region)
@@ -282,12 +603,19 @@ def beryllium_assembly(Be, ZrC):
     beryllium_assembly_cladding_cell = openmc.Cell(
         region=+beryllium_assembly & -beryllium_assembly_cladding, fill=ZrC)
     
-    beryllium_assembly_universe = openmc.Universe(cells=[beryllium_assembly_cell, beryllium_assembly_cladding_cell])
+    beryllium_assembly_universe = openmc.Universe(name='beryllium_assembly',
+                                                  cells=[beryllium_assembly_cell, beryllium_assembly_cladding_cell])
     
     return beryllium_assembly_universe
 
-def core_lattice_SNRE(tie_tube_universe, fuel_assembly_universe, beryllium_universe):
-    
+def core_lattice_SNRE(tie_tube_universe, fuel_assembly_universe, beryllium_universe,
+                      axial_layers=1, core_height=None):
+    """
+    returns the core lattice universe. With axial_layers > 1 the lattice is
+    stacked into that many layers over core_height, every cell inside it then
+    has one distribcell instance per element and layer
+    """
+
     # Measurements from Schnitzler et al. 2012
     assembly_pitch = 1.905
     
@@ -320,6 +648,11 @@ def core_lattice_SNRE(tie_tube_universe, fuel_assembly_universe, beryllium_unive
                               [FA]*6,
                               [TT]]
     core_lattice.center=(0.0,0.0)
+
+    if axial_layers > 1:
+        core_lattice.pitch = (assembly_pitch, core_height/axial_layers)
+        core_lattice.universes = [core_lattice.universes]*axial_layers
+        core_lattice.center = (0.0, 0.0, 0.0)
     core_lattice_cell = openmc.Cell(fill=core_lattice)
     core_lattice_universe = openmc.Universe(cells=[core_lattice_cell])
     
@@ -358,7 +691,52 @@ def inner_reflector(Core, Gap, SS, Be_Barrel):
     
     return reflector_universe
 
-def full_core(inner_reflector_universe, poison_mat, reflector_mat, bolt_mat, core_height, drum_clocking):
+def symmetry_wedge(symmetry, clocking=0):
+    """
+    returns the region of the core wedge starting at the +x axis for a
+    symmetry reduced model, or None for the full core
+
+    'sixth': 60 degree wedge with rotational periodic planes, needs drum k
+    and drum k+2 to have the same clocking
+    'twelfth': 30 degree wedge with reflective planes, needs every drum at
+    the same clocking of 0 or 180 so the drums are mirror symmetric
+    """
+    if symmetry == 'full':
+        return None
+
+    clockings = drum_clockings(clocking)
+    if symmetry == 'sixth':
+        angle = 60
+        if not np.allclose(clockings, np.roll(clockings, 2)):
+            raise ValueError('sixth core symmetry needs drum k and k+2 at the same clocking')
+    elif symmetry == 'twelfth':
+        angle = 30
+        mirrored = np.isclose(np.mod(clockings, 180), 0) | np.isclose(np.mod(clockings, 180), 180)
+        if not (np.allclose(clockings, clockings[0]) and np.all(mirrored)):
+            raise ValueError('twelfth core symmetry needs every drum at 0 or 180 degrees')
+    else:
+        raise ValueError(f'unknown symmetry {symmetry}')
+
+    lower = openmc.YPlane(y0=0)
+    upper = openmc.Plane.from_points((0,0,0),(0,0,1),(np.cos(np.deg2rad(angle)),
+                                                      np.sin(np.deg2rad(angle)),
+                                                      0))
+    if symmetry == 'sixth':
+        lower.boundary_type = 'periodic'
+        upper.boundary_type = 'periodic'
+        lower.periodic_surface = upper
+    else:
+        lower.boundary_type = 'reflective'
+        upper.boundary_type = 'reflective'
+
+    return +lower & -upper
+
+def full_core(inner_reflector_universe, poison_mat, reflector_mat, bolt_mat, core_height, drum_clocking,
+              reflector_mode='sectors', symmetry='full'):
+    """
+    symmetry: 'full', or 'sixth'/'twelfth' to cut the core down to a wedge,
+    see symmetry_wedge
+    """
 
     inner_reflector_outer_radius = 33.6550
     reflector_outer_radius = inner_reflector_outer_radius + 14.7
@@ -376,75 +754,521 @@ def full_core(inner_reflector_universe, poison_mat, reflector_mat, bolt_mat, cor
     core_top.boundary_type = 'vacuum'
     
     # OpenMC Cells and Universes:
-    reflector_universe = reflector(poison_mat, reflector_mat, bolt_mat, clocking=drum_clocking)
+    reflector_universe = reflector(poison_mat, reflector_mat, bolt_mat, clocking=drum_clocking,
+                                   mode=reflector_mode)
     inner_reflector_cell = openmc.Cell(region = -inner_reflector_outer_boundary
                                        & +core_bottom & -core_top, fill = inner_reflector_universe)
     reflector_cell = openmc.Cell(region= +inner_reflector_outer_boundary & -outer_reflector_outer_boundary
                                  & +core_bottom & -core_top, fill=reflector_universe)
     
+    wedge = symmetry_wedge(symmetry, drum_clocking)
+    if wedge is not None:
+        inner_reflector_cell.region &= wedge
+        reflector_cell.region &= wedge
+
     full_core_universe = openmc.Universe(cells=[inner_reflector_cell, reflector_cell])
     
     return full_core_universe
 
-def get_model(height, clocking, graphite_fuel='graphite_fuel_435U_30C'):
+def set_temperatures(geometry, temperatures):
     """
-    returns a full core with the given height, drum clocking, and fuel,
-    distributed source over core region, and shannon entropy mesh.
+    temperatures: {name: K or f(x, y, z) -> K} where names are lattice
+    element universes ('fuel_assembly', 'tie_tube', 'beryllium_assembly')
+    or materials, a material name wins over the element it is in
+
+    cells inside the core lattice get one temperature per distribcell
+    instance, callables are evaluated at the element center (the layer
+    center with axial_layers) so radial and axial profiles follow the
+    lattice. Cells outside the lattice only take a single value.
+
+    returns the cells whose temperature was set and every temperature used
     """
-    inner_gap_inner_radius = 29.5275
+    geometry.determine_paths()
+    lattices = geometry.get_all_lattices()
 
-    materials = openmc.Materials.from_xml('materials.xml')
+    # the named lattice element each cell is in
+    element_of = {}
+    for universe in geometry.get_all_universes().values():
+        if universe.name in temperatures:
+            for cell_id in universe.get_all_cells():
+                element_of[cell_id] = universe.name
 
-    # changes these materials as necessary, probably only fuel
-    graphite_fuel = get_material(materials, graphite_fuel)
-    hydrogen = get_material(materials, 'Hydrogen STP')
-    ZrC = get_material(materials, "zirconium_carbide")
-    inconel = get_material(materials, "inconel-718")
-    ZrH = get_material(materials, "zirconium_hydride_II")
-    ZrC_insulator = get_material(materials, "zirconium_carbide_insulator")
-    graphite = get_material(materials, "graphite_carbon")
-    beryllium = get_material(materials, 'Beryllium')
-    SS316L = get_material(materials, "SS316L")
-    poison = get_material(materials, "copper_boron")
+    cells = []
+    values = []
+    for cell in geometry.get_all_cells().values():
+        if cell.fill_type not in ('material', 'distribmat'):
+            continue
+
+        material_name = cell.fill.name if cell.fill_type == 'material' else None
+        if material_name in temperatures:
+            value = temperatures[material_name]
+        elif cell.id in element_of:
+            value = temperatures[element_of[cell.id]]
+        else:
+            continue
+
+        if callable(value):
+            indices = path_indices(cell.paths, lattices)
+            if None in indices:
+                raise ValueError(f'cell {cell.id} is outside the core lattice, '
+                                 f'it needs a single temperature')
+            profile = value
+            value = []
+            for lattice, idx in indices:
+                center = -np.asarray(lattice.get_local_position((0., 0., 0.), idx))
+                z = center[2] if center.size == 3 else 0.
+                value.append(float(profile(center[0], center[1], z)))
+            values.extend(value)
+            value = value if len(value) > 1 else value[0]
+        else:
+            values.append(value)
 
+        cell.temperature = value
+        cells.append(cell)
 
-    # make all the sub elements of the reactor
-    FA = fuel_assembly(hydrogen, ZrC, graphite_fuel)
-    TT = tie_tube(hydrogen,hydrogen,inconel,ZrH,ZrC,ZrC_insulator,graphite)
-    BE = beryllium_assembly(beryllium, ZrC)
+    return cells, values
 
-    core_lattice_SNRE_geom = openmc.Geometry(core_lattice_SNRE(TT, FA, BE))
-    core_lattice_SNRE_geom.plot(pixels=(800, 800), width=(60, 60),
-                                color_by='material')
+def doppler_settings(values, default=2500, doppler='interpolation'):
+    """
+    returns settings.temperature for the temperatures in values
+    doppler: 'interpolation' between library temperatures, 'multipole' to
+    also use windowed multipole data in the resolved resonance range, or
+    'nearest'. Only library temperatures in the range of values are loaded,
+    so memory doesn't grow with the number of distinct temperatures
+    """
+    values = list(values) + [default]
+    settings = {'default': default, 'range': (min(values), max(values))}
+    if doppler == 'multipole':
+        settings.update(method='interpolation', multipole=True)
+    elif doppler in ('interpolation', 'nearest'):
+        settings['method'] = doppler
+    else:
+        raise ValueError(f'unknown doppler treatment {doppler}')
+
+    return settings
+
+def fuel_element_centers(core_lattice_universe, fuel_assembly_universe):
+    """
+    returns the (x, y) centers of every lattice position filled with
+    fuel_assembly_universe in the core lattice universe, shape (N, 2)
+    """
+    lattice = next(iter(core_lattice_universe.cells.values())).fill
+    n_rings = lattice.num_rings
+
+    centers = []
+    for i in range(-n_rings + 1, n_rings):
+        for j in range(-n_rings + 1, n_rings):
+            # bottom layer of an axially stacked lattice
+            idx = (i, j) if lattice.num_axial is None else (i, j, 0)
+            if (lattice.is_valid_index(idx) and
+                    lattice.get_universe(idx) is fuel_assembly_universe):
+                # position of the origin relative to the element center
+                local = lattice.get_local_position((0., 0., 0.), idx)
+                centers.append((-local[0], -local[1]))
+
+    return np.array(centers)
+
+def fuel_offsets(fuel_assembly_universe, fuel_name, n_candidates=4000, seed=1):
+    """
+    returns (x, y) points relative to the element center that lie in fuel,
+    found once by locating candidate points in the element universe, and the
+    fraction of the element hexagon that is fuel
+    """
+    flat_to_flat = element_flat_to_flat
+    edge_length = 0.5*flat_to_flat/np.cos(np.deg2rad(30))
+
+    # candidates uniform in the element hexagon (orientation 'x')
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(-1, 1, (n_candidates, 2))*(edge_length, flat_to_flat/2)
+    inside = (np.abs(xy[:, 0])*np.sqrt(3)/2 + np.abs(xy[:, 1])/2) <= flat_to_flat/2
+    xy = xy[inside]
+
+    in_fuel = np.zeros(len(xy), dtype=bool)
+    for n, (x, y) in enumerate(xy):
+        path = fuel_assembly_universe.find((x, y, 0.))
+        cell = path[-1]
+        if not isinstance(cell, openmc.Cell):
+            continue
+        # the fuel_element cell itself in 'union' mode (also with per element
+        # multigroup fills), the fuel cells of the channel lattice otherwise
+        fill = cell.fill
+        in_fuel[n] = (cell.name == 'fuel_element' or
+                      (isinstance(fill, openmc.Material) and fill.name == fuel_name))
+
+    return xy[in_fuel], in_fuel.mean()
+
+def fuel_source(centers, offsets, height, points_per_element=32,
+                wedge_angle=None, seed=1):
+    """
+    returns a PointCloud with points_per_element points in the fuel of every
+    element, uniform in z over the core height, so no source site is
+    rejected. wedge_angle: only keep points in the symmetry wedge
+    """
+    rng = np.random.default_rng(seed)
+    choice = rng.integers(len(offsets), size=(len(centers), points_per_element))
+    xy = (centers[:, None, :] + offsets[choice]).reshape(-1, 2)
 
-    core = core_lattice_SNRE(TT,FA,BE)
-    inner_reflector_universe = inner_reflector(core, hydrogen, SS316L, beryllium)
+    if wedge_angle is not None:
+        angle = np.rad2deg(np.arctan2(xy[:, 1], xy[:, 0]))
+        xy = xy[(angle >= 0) & (angle < wedge_angle)]
 
-    # combine them into a full core
-    full_core_geom = openmc.Geometry(full_core(inner_reflector_universe, poison, 
-                                            beryllium, inconel, height, clocking))
-    
-    #setup shannon entropy
-    lower_left = (-inner_gap_inner_radius, -inner_gap_inner_radius, -height/2)
-    upper_right = (inner_gap_inner_radius, inner_gap_inner_radius, height/2)
+    z = rng.uniform(-height/2, height/2, len(xy))
+    return openmc.stats.PointCloud(np.column_stack([xy, z]))
+
+def multigroup_materials(materials, mgxs_file, element_domain='fuel_element'):
+    """
+    returns a macroscopic copy of every material in materials that has a
+    cross section set with the same name in the mgxs_file library (the
+    library only covers materials used in its reference run), and the
+    per fuel element materials (element_domain_0, element_domain_1, ...)
+    if the library has them, otherwise an empty list
+    """
+    library = openmc.MGXSLibrary.from_hdf5(mgxs_file)
+    names = {xsdata.name for xsdata in library.xsdatas}
 
-    entropy_mesh = openmc.RegularMesh()
-    entropy_mesh.lower_left = lower_left
-    entropy_mesh.upper_right = upper_right
-    entropy_mesh.dimension = [30,30,10]
+    mg_materials = openmc.Materials()
+    for material in materials:
+        if material.name not in names:
+            continue
+        mg_material = openmc.Material(name=material.name)
+        mg_material.add_macroscopic(material.name)
+        mg_material.set_density('macro', 1.0)
+        mg_materials.append(mg_material)
+
+    element_materials = []
+    while f'{element_domain}_{len(element_materials)}' in names:
+        name = f'{element_domain}_{len(element_materials)}'
+        mg_material = openmc.Material(name=name)
+        mg_material.add_macroscopic(name)
+        mg_material.set_density('macro', 1.0)
+        element_materials.append(mg_material)
+
+    return mg_materials, element_materials
+
+class ModelBuilder:
+    """
+    builds full core models for parameter sweeps without repeating work.
+    materials.xml is parsed once, and the universes that don't depend on
+    height or drum clocking (FA, TT, BE and the inner reflector) are built
+    once per fuel and fuel_mode. Only the reflector, axial planes and
+    settings are rebuilt for each model.
+
+    every model gets a deep copy of the cached universes and materials
+    (with the same ids), so a model can be changed or kept around while
+    others are built without affecting them.
+
+    with an mgxs_file (see mgxs_library.py) every material is replaced by
+    its macroscopic multigroup cross sections and the models run in
+    multi-group mode. If the library has per fuel element cross sections
+    each fuel element gets its own, this needs fuel_mode='union'.
+    """
 
-    #setup source sampling
-    uniform_dist = openmc.stats.Box(lower_left, upper_right, 
-                                    only_fissionable = True)
+    def __init__(self, materials_file='materials.xml', mgxs_file=None):
+        self.materials_file = materials_file
+        self.mgxs_file = mgxs_file
+        self.materials = openmc.Materials.from_xml(materials_file)
+        self.element_materials = []
+        if mgxs_file is not None:
+            self.materials, self.element_materials = multigroup_materials(
+                self.materials, mgxs_file)
+        self.build_times = []
+        self._cores = {}
+        self._fuel_assemblies = {}
+        self._fuel_offsets = {}
+        self._indices = {}
+        self._inner_reflectors = {}
+
+    def core_lattice(self, graphite_fuel, fuel_mode='union', axial_layers=1,
+                     height=None):
+        """
+        returns the (cached) SNRE core lattice universe for the given fuel
+        and fuel_mode, stacked in axial_layers over height if axial_layers > 1
+        """
+        key = (graphite_fuel, fuel_mode)
+        if axial_layers > 1:
+            key += (axial_layers, height)
+        if key not in self._cores:
+            materials = self.materials
+            if self.mgxs_file is not None and graphite_fuel not in {m.name for m in materials}:
+                raise KeyError(f'{graphite_fuel} has no cross sections in {self.mgxs_file}')
+
+            fuel = get_material(materials, graphite_fuel)
+            hydrogen = get_material(materials, 'Hydrogen STP')
+            ZrC = get_material(materials, "zirconium_carbide")
+            inconel = get_material(materials, "inconel-718")
+            ZrH = get_material(materials, "zirconium_hydride_II")
+            ZrC_insulator = get_material(materials, "zirconium_carbide_insulator")
+            graphite = get_material(materials, "graphite_carbon")
+            beryllium = get_material(materials, 'Beryllium')
+
+            # make all the sub elements of the reactor
+            FA = fuel_assembly(hydrogen, ZrC, fuel, mode=fuel_mode)
+            TT = tie_tube(hydrogen,hydrogen,inconel,ZrH,ZrC,ZrC_insulator,graphite)
+            BE = beryllium_assembly(beryllium, ZrC)
+
+            core = core_lattice_SNRE(TT,FA,BE, axial_layers, height)
+
+            if self.element_materials:
+                if fuel_mode != 'union':
+                    raise ValueError('per element cross sections need fuel_mode union')
+                # distributed fill, one material per fuel element instance
+                geometry = openmc.Geometry(core)
+                fuel_cell = get_cell(geometry, 'fuel_element')
+                geometry.determine_paths()
+                if fuel_cell.num_instances != len(self.element_materials):
+                    raise ValueError(f'{self.mgxs_file} has cross sections for '
+                                     f'{len(self.element_materials)} fuel elements, '
+                                     f'the core has {fuel_cell.num_instances}')
+                fuel_cell.fill = self.element_materials
+
+            self._cores[key] = core
+            self._fuel_assemblies[key] = FA
+
+        return self._cores[key]
+
+    def fuel_source(self, graphite_fuel, fuel_mode, height, symmetry='full',
+                    points_per_element=32):
+        """
+        returns the fuel source distribution of the core lattice, the points
+        in fuel of one element are located once per fuel and fuel_mode
+        """
+        key = (graphite_fuel, fuel_mode)
+        core = self.core_lattice(graphite_fuel, fuel_mode)
+        if key not in self._fuel_offsets:
+            FA = self._fuel_assemblies[key]
+            centers = fuel_element_centers(core, FA)
+            offsets, fraction = fuel_offsets(FA, graphite_fuel)
+            self._fuel_offsets[key] = (centers, offsets, fraction)
+
+        centers, offsets, _ = self._fuel_offsets[key]
+        wedge_angle = {'full': None, 'sixth': 60, 'twelfth': 30}[symmetry]
+        return fuel_source(centers, offsets, height, points_per_element,
+                           wedge_angle)
+
+    def distribcell_index(self, graphite_fuel, fuel_mode='union', axial_layers=1,
+                          height=None):
+        """
+        returns the (cached) distribcell index of the fuel_element cell for
+        the core lattice, see distribcell_index. The lattice is the only way
+        into the fuel elements, so instances are numbered the same in the
+        lattice alone and in the full core
+        """
+        key = (graphite_fuel, fuel_mode)
+        if axial_layers > 1:
+            key += (axial_layers, height)
+        if key not in self._indices:
+            core = self.core_lattice(graphite_fuel, fuel_mode, axial_layers, height)
+            self._indices[key] = distribcell_index(openmc.Geometry(core))
+
+        return self._indices[key]
+
+    def load_fuel(self, geometry, materials, fuel_loading, graphite_fuel,
+                  fuel_mode='union', axial_layers=1, height=None):
+        """
+        fills the fuel elements of a model's geometry with a distributed
+        fill of its materials. fuel_loading is {core lattice ring: material
+        name}, with rings numbered like core_lattice_SNRE (0 outermost) and
+        rings not listed keeping graphite_fuel, or a material name (or
+        openmc.Material, e.g. depletion bins, which the caller adds to
+        model.materials) per distribcell instance. Unknown names raise
+        KeyError
+        """
+        if fuel_mode != 'union' or self.element_materials:
+            raise ValueError('fuel loadings need fuel_mode union and a '
+                             'library without per element cross sections')
+
+        index = self.distribcell_index(graphite_fuel, fuel_mode, axial_layers, height)
+        if isinstance(fuel_loading, dict):
+            names = [fuel_loading.get(int(ring), graphite_fuel) for ring in index['ring']]
+        else:
+            names = list(fuel_loading)
+            if len(names) != len(index['ring']):
+                raise ValueError(f'{len(names)} fuels for {len(index["ring"])} '
+                                 f'fuel element instances')
+
+        fuels = {name: get_material(materials, name) for name in set(names)
+                 if not isinstance(name, openmc.Material)}
+        get_cell(geometry, 'fuel_element').fill = [
+            name if isinstance(name, openmc.Material) else fuels[name]
+            for name in names]
+
+    def inner_reflector(self, graphite_fuel, fuel_mode='union', axial_layers=1,
+                        height=None):
+        """
+        returns the (cached) core lattice inside the inner reflector for the
+        given fuel and fuel_mode, see core_lattice for axial_layers
+        """
+        key = (graphite_fuel, fuel_mode)
+        if axial_layers > 1:
+            key += (axial_layers, height)
+        if key not in self._inner_reflectors:
+            hydrogen = get_material(self.materials, 'Hydrogen STP')
+            beryllium = get_material(self.materials, 'Beryllium')
+            SS316L = get_material(self.materials, "SS316L")
+
+            core = self.core_lattice(graphite_fuel, fuel_mode, axial_layers, height)
+            self._inner_reflectors[key] = inner_reflector(core, hydrogen,
+                                                          SS316L, beryllium)
+
+        return self._inner_reflectors[key]
+
+    def get_model(self, height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+                  fuel_mode='union', reflector_mode='sectors', plot=False,
+                  symmetry='full', source='fuel', axial_layers=1,
+                  temperatures=None, doppler='interpolation', fuel_loading=None):
+        """
+        returns a full core with the given height, drum clocking, and fuel,
+        initial source in the fuel (see source), and shannon entropy mesh.
+        clocking can be one angle or a list of 12, one per drum
+        fuel_mode is passed to fuel_assembly ('union' or 'lattice')
+        reflector_mode is passed to reflector ('sectors' or 'union')
+        plot: also plot the core lattice by material
+        symmetry: 'full', 'sixth' or 'twelfth', see symmetry_wedge. The
+        lattice is not cut, so distribcell indexing is the same as the full
+        core and symmetry.unfold maps results back onto it
+        source: 'fuel' samples the initial source only inside the fuel of
+        the fuel elements (see fuel_source), 'box' uses a fissionable only
+        Box over the core, which rejects most of its samples
+        axial_layers: stack the core lattice in this many layers so
+        distribcell tallies on fuel_element give an element by axial layer
+        map, see power_map.py
+        temperatures: per element, per material and per instance
+        temperatures, see set_temperatures, 'default' is used everywhere
+        else. doppler picks the temperature treatment, see doppler_settings.
+        Without temperatures settings.temperature is left for the caller
+        fuel_loading: fuel per lattice ring or per element, see load_fuel,
+        graphite_fuel is the fuel everywhere else
+        """
+        start = time.perf_counter()
+
+        inner_gap_inner_radius = 29.5275
+
+        inconel = get_material(self.materials, "inconel-718")
+        beryllium = get_material(self.materials, 'Beryllium')
+        poison = get_material(self.materials, "copper_boron")
+
+        inner_reflector_universe = self.inner_reflector(graphite_fuel, fuel_mode,
+                                                        axial_layers, height)
+
+        # combine them into a full core
+        full_core_geom = openmc.Geometry(full_core(inner_reflector_universe, poison, 
+                                                beryllium, inconel, height, clocking,
+                                                reflector_mode, symmetry))
+        materials = openmc.Materials(list(self.materials) + self.element_materials)
+
+        # the model gets its own cells, universes and materials (ids kept),
+        # so changing one model never changes another or the cache
+        full_core_geom, materials = copy.deepcopy((full_core_geom, materials))
+
+        if fuel_loading is not None:
+            self.load_fuel(full_core_geom, materials, fuel_loading, graphite_fuel,
+                           fuel_mode, axial_layers, height)
+
+        #setup shannon entropy, over the bounding box of the symmetry wedge
+        lower_left = (-inner_gap_inner_radius, -inner_gap_inner_radius, -height/2)
+        upper_right = (inner_gap_inner_radius, inner_gap_inner_radius, height/2)
+        if symmetry != 'full':
+            wedge_angle = {'sixth': 60, 'twelfth': 30}[symmetry]
+            lower_left = (0, 0, -height/2)
+            upper_right = (inner_gap_inner_radius,
+                           inner_gap_inner_radius*np.sin(np.deg2rad(wedge_angle)),
+                           height/2)
+
+        entropy_mesh = openmc.RegularMesh()
+        entropy_mesh.lower_left = lower_left
+        entropy_mesh.upper_right = upper_right
+        entropy_mesh.dimension = [30,30,10]
+
+        #setup source sampling
+        if source == 'fuel':
+            space = self.fuel_source(graphite_fuel, fuel_mode, height, symmetry)
+        elif source == 'box':
+            space = openmc.stats.Box(lower_left, upper_right,
+                                     only_fissionable = True)
+        else:
+            raise ValueError(f'unknown source {source}')
 
-    settings = openmc.Settings()
-    settings.entropy_mesh = entropy_mesh
-    settings.source = openmc.IndependentSource(space=uniform_dist)
+        settings = openmc.Settings()
+        settings.entropy_mesh = entropy_mesh
+        settings.source = openmc.IndependentSource(space=space)
 
-    model = openmc.Model(materials=materials, settings=settings, 
-                         geometry=full_core_geom)
-    
-    return model
+        if temperatures:
+            profiles = {k: v for k, v in temperatures.items() if k != 'default'}
+            # on the model's own copy of the cells
+            _, values = set_temperatures(full_core_geom, profiles)
+            settings.temperature = doppler_settings(
+                values, temperatures.get('default', 2500), doppler)
+
+        if self.mgxs_file is not None:
+            settings.energy_mode = 'multi-group'
+            materials.cross_sections = self.mgxs_file
+
+        model = openmc.Model(materials=materials, settings=settings,
+                             geometry=full_core_geom)
+
+        self.build_times.append(time.perf_counter() - start)
+
+        if plot:
+            # the model's own copy of its lattice, with any fuel loading
+            core_id = self.core_lattice(graphite_fuel, fuel_mode, axial_layers,
+                                        height).id
+            core = full_core_geom.get_all_universes()[core_id]
+            openmc.Geometry(core).plot(pixels=(800, 800), width=(60, 60),
+                                       color_by='material')
+
+        return model
+
+    def report(self):
+        """
+        prints how many models were built and how long it took
+        """
+        if not self.build_times:
+            print('no models built yet')
+            return
+
+        times = np.array(self.build_times)
+        print(f'{times.size} models built in {times.sum():.3f} s, '
+              f'first {times[0]:.3f} s, mean {times.mean():.3f} s, '
+              f'max {times.max():.3f} s')
+
+        for (fuel, fuel_mode), (centers, _, fraction) in self._fuel_offsets.items():
+            print(f'{fuel} ({fuel_mode}): {len(centers)} fuel elements, '
+                  f'{fraction:.3f} of each element is fuel')
+
+
+_model_builders = {}
+
+def get_model_builder(materials_file='materials.xml', mgxs_file=None):
+    """
+    returns the shared ModelBuilder for materials_file (and mgxs_file), a
+    new one is made if either file changed since it was parsed
+    """
+    files = [materials_file] + ([mgxs_file] if mgxs_file is not None else [])
+    key = tuple(os.path.abspath(f) for f in files)
+    mtime = tuple(os.path.getmtime(f) for f in files)
+
+    if key not in _model_builders or _model_builders[key][0] != mtime:
+        _model_builders[key] = (mtime, ModelBuilder(materials_file, mgxs_file))
+
+    return _model_builders[key][1]
+
+def get_model(height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+              fuel_mode='union', reflector_mode='sectors', plot=False,
+              symmetry='full', mgxs_file=None, source='fuel',
+              axial_layers=1, temperatures=None, doppler='interpolation',
+              fuel_loading=None):
+    """
+    returns a full core with the given height, drum clocking, and fuel,
+    initial source in the fuel, and shannon entropy mesh.
+    see ModelBuilder.get_model, the shared builder for materials.xml is used
+    so repeated calls reuse the parsed materials and core universes
+    mgxs_file: multigroup library from mgxs_library.py, runs the model in
+    multi-group mode instead of continuous energy
+    """
+    builder = get_model_builder(mgxs_file=mgxs_file)
+    return builder.get_model(height, clocking, graphite_fuel, fuel_mode,
+                             reflector_mode, plot, symmetry, source,
+                             axial_layers, temperatures, doppler, fuel_loading)
 
 
 def main():
@@ -0,0 +1,168 @@
+"""
+Heating modes for the fuel element heating tally.
+
+'coupled' runs with photon transport and tallies the neutron and photon
+'heating' score, 'local' runs neutron only and tallies 'heating-local',
+which deposits the photon energy (from the KERMA of the photon producing
+reactions) where the neutron collided. Both are a 'Total Heating' tally on
+the fuel element distribcell filter, next to the 'Heating' kappa-fission
+tally the post processing already uses.
+
+A calibration runs the same model in both modes and records how far the
+local estimate is from coupled transport, per element and in total, and
+how both compare to kappa-fission, in heating_calibration.json.
+"""
+
+import argparse
+import datetime
+import json
+import os
+
+import h5py
+import numpy as np
+import openmc
+
+import benchmark
+import geometry_definitions as gd
+import post_processing as pp
+
+
+def heating_tally(geometry, heating_mode='local'):
+    """
+    returns the 'Total Heating' tally on the fuel element distribcell filter
+    for heating_mode 'local' or 'coupled'
+    """
+    fuel_cell = gd.get_cell(geometry, 'fuel_element')
+    tally = openmc.Tally(name='Total Heating')
+    if heating_mode == 'local':
+        tally.filters = [openmc.DistribcellFilter(fuel_cell)]
+        tally.scores = ['heating-local']
+    elif heating_mode == 'coupled':
+        tally.filters = [openmc.DistribcellFilter(fuel_cell),
+                         openmc.ParticleFilter(['neutron', 'photon'])]
+        tally.scores = ['heating']
+    else:
+        raise ValueError(f'unknown heating mode {heating_mode}')
+
+    return tally
+
+
+def apply_heating_mode(model, heating_mode='local'):
+    """
+    turns photon transport on or off for heating_mode and adds the
+    'Total Heating' tally to the model, returns the tally
+    """
+    model.settings.photon_transport = heating_mode == 'coupled'
+    tally = heating_tally(model.geometry, heating_mode)
+    model.tallies.append(tally)
+    return tally
+
+
+def element_heating(statepoint):
+    """
+    returns per element total heating and kappa-fission as fractions of
+    their sums, with std devs
+    """
+    results = {}
+    with h5py.File(statepoint, 'r') as f:
+        for name in ('Total Heating', 'Heating'):
+            reduced = pp.reduce_tally(f, name)
+            total = reduced['mean'].sum()
+            results[name] = (reduced['mean']/total, reduced['std_dev']/total, total)
+
+    return results
+
+
+def compare(local_statepoint, coupled_statepoint):
+    """
+    returns the local vs coupled heating errors and both against
+    kappa-fission
+    """
+    local = element_heating(local_statepoint)
+    coupled = element_heating(coupled_statepoint)
+
+    def rel_diff(a, b):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(b > 0, a/b - 1, 0)
+
+    local_vs_coupled = rel_diff(local['Total Heating'][0], coupled['Total Heating'][0])
+    sigma = np.hypot(local['Total Heating'][1], coupled['Total Heating'][1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_sigma = np.where(sigma > 0, (local['Total Heating'][0]
+                                       - coupled['Total Heating'][0])/sigma, 0)
+
+    return {
+        'element_max_rel_diff': float(np.abs(local_vs_coupled).max()),
+        'element_rms_rel_diff': float(np.sqrt(np.mean(local_vs_coupled**2))),
+        'element_over_3_sigma': int(np.sum(np.abs(n_sigma) > 3)),
+        # total heating per source particle, local/coupled
+        'total_ratio': float(local['Total Heating'][2]/coupled['Total Heating'][2]),
+        'coupled_vs_kappa_fission_max_rel_diff': float(np.abs(rel_diff(
+            coupled['Total Heating'][0], coupled['Heating'][0])).max()),
+        'local_vs_kappa_fission_max_rel_diff': float(np.abs(rel_diff(
+            local['Total Heating'][0], local['Heating'][0])).max()),
+    }
+
+
+def calibrate(height, clocking, directory='heating_calibration', particles=100_000,
+              batches=40, inactive=15, model_kwargs=None):
+    """
+    runs the model in both heating modes, returns the comparison and the
+    particle rate of each mode
+    """
+    statepoints = {}
+    rates = {}
+    for heating_mode in ('local', 'coupled'):
+        model = gd.get_model(height, clocking, **(model_kwargs or {}))
+        model.tallies = [openmc.Tally(name='Heating')]
+        model.tallies[0].filters = [openmc.DistribcellFilter(
+            gd.get_cell(model.geometry, 'fuel_element'))]
+        model.tallies[0].scores = ['kappa-fission']
+        apply_heating_mode(model, heating_mode)
+
+        run_directory = os.path.join(directory, heating_mode)
+        result = benchmark.measure(model, run_directory, particles=particles,
+                                   batches=batches, inactive=inactive)
+        rates[heating_mode] = result['active_pps']
+        statepoints[heating_mode] = os.path.join(run_directory,
+                                                 f'statepoint.{batches}.h5')
+
+    calibration = compare(statepoints['local'], statepoints['coupled'])
+    calibration['speedup'] = rates['local']/rates['coupled']
+    return calibration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--particles', type=int, default=100_000)
+    parser.add_argument('--history', default='heating_calibration.json')
+    args = parser.parse_args()
+
+    calibration = calibrate(args.height, args.clocking, particles=args.particles,
+                            model_kwargs={'graphite_fuel': args.fuel})
+    calibration.update(date=datetime.datetime.now().isoformat(timespec='seconds'),
+                       commit=benchmark.git_commit(), height=args.height,
+                       clocking=args.clocking, graphite_fuel=args.fuel)
+
+    print(f"local vs coupled element heating: max {calibration['element_max_rel_diff']:.4f}, "
+          f"rms {calibration['element_rms_rel_diff']:.4f}, "
+          f"{calibration['element_over_3_sigma']} elements over 3 sigma, total "
+          f"ratio {calibration['total_ratio']:.4f}")
+    print(f"vs kappa-fission: coupled {calibration['coupled_vs_kappa_fission_max_rel_diff']:.4f}, "
+          f"local {calibration['local_vs_kappa_fission_max_rel_diff']:.4f}; "
+          f"local mode is {calibration['speedup']:.2f}x faster")
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    history.append(calibration)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Radial fuel zoning optimizer.
+
+The fuel rings of the core lattice are grouped into radial zones and every
+zone gets one of the graphite_fuel_* materials (get_model(...,
+fuel_loading=...)). Candidate loadings are run concurrently in a process
+pool with cheap low particle runs, and a Gaussian process surrogate of the
+peak element power (max/mean of the kappa-fission distribcell tally) and of
+k-eff picks the next candidates by expected improvement times the
+probability of meeting the k-eff constraint. Each zone's coordinates are
+its fuel's uranium loading, carbon fraction and density. Every evaluated loading is
+cached, so reruns and longer searches reuse earlier runs.
+"""
+
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+default_fuels = ['graphite_fuel_70U_15C', 'graphite_fuel_70U_20C',
+                 'graphite_fuel_70U_30C', 'graphite_fuel_435U_30C',
+                 'graphite_fuel_435U_35C', 'graphite_fuel_435U_40C',
+                 'graphite_fuel_435U_45C']
+
+
+def fuel_zones(n_zones, graphite_fuel='graphite_fuel_435U_30C'):
+    """
+    returns the lattice rings holding fuel elements split into n_zones
+    radial zones, outermost zone first
+    """
+    index = gd.get_model_builder().distribcell_index(graphite_fuel)
+    rings = np.unique(index['ring'])
+    return [zone.tolist() for zone in np.array_split(rings, n_zones)]
+
+
+def zone_loading(zones, fuels):
+    """
+    returns {ring: fuel} for one fuel per zone
+    """
+    return {ring: fuel for zone, fuel in zip(zones, fuels) for ring in zone}
+
+
+def fuel_features(fuels):
+    """
+    returns (fuels, 3) surrogate coordinates of each fuel: uranium atom
+    density, carbon atom fraction and mass density, each scaled to [0, 1]
+    over fuels
+    """
+    materials = gd.get_model_builder().materials
+    features = []
+    for name in fuels:
+        densities = gd.get_material(materials, name).get_nuclide_atom_densities()
+        total = sum(densities.values())
+        element = {n: n.rstrip('0123456789_m') for n in densities}
+        uranium = sum(v for n, v in densities.items() if element[n] == 'U')
+        carbon = sum(v for n, v in densities.items() if element[n] == 'C')
+        features.append([uranium, carbon/total,
+                         gd.get_material(materials, name).get_mass_density()])
+
+    features = np.array(features)
+    span = features.max(axis=0) - features.min(axis=0)
+    return (features - features.min(axis=0))/np.where(span > 0, span, 1)
+
+
+def evaluate(height, clocking, zones, fuels, directory, particles, batches,
+             inactive, temperature, threads):
+    """
+    runs one loading, returns k-eff, its std dev, and the peak element power
+    over the mean
+    """
+    model = gd.get_model(height, clocking, fuels[0],
+                         fuel_loading=zone_loading(zones, fuels))
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': temperature}
+
+    heating_tally = openmc.Tally(name='Heating')
+    heating_tally.filters = [openmc.DistribcellFilter(
+        gd.get_cell(model.geometry, 'fuel_element'))]
+    heating_tally.scores = ['kappa-fission']
+    model.tallies = [heating_tally]
+
+    os.makedirs(directory, exist_ok=True)
+    statepoint = model.run(cwd=directory, threads=threads, output=False)
+
+    with h5py.File(statepoint, 'r') as f:
+        keff = f['k_combined'][()]
+        power = pp.reduce_tally(f, 'Heating')['mean']
+
+    return float(keff[0]), float(keff[1]), float(power.max()/power.mean())
+
+
+def rbf_kernel(a, b, length_scale):
+    d2 = ((a[:, None, :] - b[None, :, :])**2).sum(axis=2)
+    return np.exp(-0.5*d2/length_scale**2)
+
+
+def fit_length_scale(X, y, noise, length_scales=np.geomspace(0.05, 3, 25)):
+    """
+    returns the RBF length scale with the largest log marginal likelihood
+    of the standardized y
+    """
+    y = (y - y.mean())/(y.std() or 1.)
+    best, best_ll = length_scales[0], -np.inf
+    for length_scale in length_scales:
+        K = rbf_kernel(X, X, length_scale) + np.diag(noise + 1e-8)
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            continue
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        ll = -0.5*y @ alpha - np.log(np.diag(L)).sum()
+        if ll > best_ll:
+            best, best_ll = length_scale, ll
+    return best
+
+
+def gaussian_process(X, y, noise, length_scale=None):
+    """
+    returns predict(X_new) -> (mean, std dev) of an RBF Gaussian process
+    through (X, y) with per point noise variance, the length scale is fitted
+    by marginal likelihood unless given
+    """
+    offset, scale = y.mean(), y.std() or 1.
+    y = (y - offset)/scale
+    if length_scale is None:
+        length_scale = fit_length_scale(X, y, noise/scale**2)
+
+    K = rbf_kernel(X, X, length_scale) + np.diag(noise/scale**2 + 1e-8)
+    L = np.linalg.cholesky(K)
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+
+    def predict(X_new):
+        k = rbf_kernel(X_new, X, length_scale)
+        mean = k @ alpha
+        v = np.linalg.solve(L, k.T)
+        var = np.maximum(1 - (v**2).sum(axis=0), 1e-12)
+        return offset + scale*mean, scale*np.sqrt(var)
+
+    return predict
+
+
+normal_cdf = np.vectorize(lambda z: 0.5*(1 + math.erf(z/math.sqrt(2))))
+
+
+def acquisition(candidates, X, peaks, keffs, sigmas, k_min):
+    """
+    expected improvement of the peak times the probability k-eff >= k_min
+    """
+    feasible = keffs >= k_min
+    best = peaks[feasible].min() if feasible.any() else peaks.max()
+
+    mu, s = gaussian_process(X, peaks, np.full(len(peaks), 1e-4))(candidates)
+    z = (best - mu)/s
+    ei = (best - mu)*normal_cdf(z) + s*np.exp(-0.5*z**2)/np.sqrt(2*np.pi)
+
+    k_mu, k_s = gaussian_process(X, keffs, sigmas**2)(candidates)
+    return ei*normal_cdf((k_mu - k_min)/k_s)
+
+
+def optimize(height, clocking, n_zones=4, fuels=None, k_min=1.0,
+             n_parallel=4, n_initial=8, n_iterations=6, particles=20_000,
+             batches=40, inactive=15, temperature=2500,
+             run_directory='loading_optimizer', cache_file='loading_cache.json',
+             seed=1):
+    """
+    returns the best feasible loading found and every evaluation
+    """
+    fuels = fuels or default_fuels
+    zones = fuel_zones(n_zones)
+    features = fuel_features(fuels)
+    threads = max(1, (os.cpu_count() or 1)//n_parallel)
+    rng = np.random.default_rng(seed)
+
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    def key(choice):
+        # every run setting, so results of other settings are never reused
+        return json.dumps([height, clocking, particles, batches, inactive,
+                           temperature, zones, [fuels[i] for i in choice]])
+
+    # every loading, or a random sample when there are too many
+    n_candidates = len(fuels)**n_zones
+    if n_candidates <= 20_000:
+        candidates = np.array(np.unravel_index(np.arange(n_candidates),
+                                               [len(fuels)]*n_zones)).T
+    else:
+        candidates = rng.integers(len(fuels), size=(20_000, n_zones))
+
+    def current():
+        # cached runs of these settings
+        return [e for k, e in cache.items() if k == key(e['choice'])]
+
+    def run_batch(choices, pool, iteration):
+        new = [c for c in choices if key(c) not in cache]
+        futures = [pool.submit(evaluate, height, clocking, zones,
+                               [fuels[i] for i in choice],
+                               os.path.join(run_directory, f'iter{iteration}_{n}'),
+                               particles, batches, inactive, temperature,
+                               threads)
+                   for n, choice in enumerate(new)]
+        for choice, future in zip(new, futures):
+            keff, sigma, peak = future.result()
+            cache[key(choice)] = {'fuels': [fuels[i] for i in choice],
+                                  'choice': [int(i) for i in choice],
+                                  'keff': keff, 'std_dev': sigma, 'peak': peak}
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent=1)
+
+    with ProcessPoolExecutor(max_workers=n_parallel) as pool:
+        initial = candidates[rng.choice(len(candidates), n_initial, replace=False)]
+        run_batch([tuple(c) for c in initial], pool, 0)
+
+        for iteration in range(1, n_iterations + 1):
+            evaluated = current()
+            X = features[np.array([e['choice'] for e in evaluated])].reshape(len(evaluated), -1)
+            peaks = np.array([e['peak'] for e in evaluated])
+            keffs = np.array([e['keff'] for e in evaluated])
+            sigmas = np.array([e['std_dev'] for e in evaluated])
+
+            score = acquisition(features[candidates].reshape(len(candidates), -1),
+                                X, peaks, keffs, sigmas, k_min)
+            done = np.array([key(tuple(c)) in cache for c in candidates])
+            score[done] = -np.inf
+            picks = candidates[np.argsort(score)[::-1][:n_parallel]]
+            run_batch([tuple(c) for c in picks], pool, iteration)
+
+            feasible = [e for e in current() if e['keff'] >= k_min]
+            if feasible:
+                best = min(feasible, key=lambda e: e['peak'])
+                print(f"iteration {iteration}: best peak {best['peak']:.3f} at "
+                      f"k-eff {best['keff']:.5f}, {best['fuels']}")
+
+    evaluations = current()
+    feasible = [e for e in evaluations if e['keff'] >= k_min]
+    best = min(feasible, key=lambda e: e['peak']) if feasible else None
+    return {'zones': zones, 'best': best, 'evaluations': evaluations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--zones', type=int, default=4)
+    parser.add_argument('--k-min', type=float, default=1.0)
+    parser.add_argument('--parallel', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=6)
+    parser.add_argument('--particles', type=int, default=20_000)
+    parser.add_argument('--temperature', type=float, default=2500)
+    args = parser.parse_args()
+
+    result = optimize(args.height, args.clocking, args.zones, k_min=args.k_min,
+                      n_parallel=args.parallel, n_iterations=args.iterations,
+                      particles=args.particles, temperature=args.temperature)
+
+    best = result['best']
+    if best is None:
+        print(f"no loading reached k-eff {args.k_min} in "
+              f"{len(result['evaluations'])} evaluations")
+    else:
+        for zone, fuel in zip(result['zones'], best['fuels']):
+            print(f'rings {zone}: {fuel}')
+        print(f"peak element power / mean {best['peak']:.3f}, k-eff "
+              f"{best['keff']:.5f} +/- {best['std_dev']:.5f}")
+
+    with open('loading_optimizer.json', 'w') as f:
+        json.dump(result, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
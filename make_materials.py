@@ -1,11 +1,18 @@
-from pyne.material import Material, MultiMaterial
-from pyne.material_library import MaterialLibrary
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import warnings
 
+import numpy as np
+import openmc
+import openmc.data
+from openmc.mixin import IDWarning
 
-# sorry this uses pyne but it makes it so much easier
-# u can pull this docker image for a working version
-# docker pull ejpflug/openmc_chtc:08
-# I will also write out a materials.xml and push that to github
+
+# builds materials.xml with openmc only, natural elements are expanded with
+# openmc.data.NATURAL_ABUNDANCE and mixtures use openmc.Material.mix_materials
 
 # these materials are perfectly pure, so not 100% realistic
 
@@ -13,91 +20,152 @@ from pyne.material_library import MaterialLibrary
 # TAUB 1975 Review of fuel element development for nuclear rocket engines
 # in table 6 of the taub paper many possible fuel compositions are listed
 
+# bump this if the way materials are computed changes outside this module
+# (e.g. openmc.data), so cached entries are recomputed. Edits to the
+# builder functions here are picked up by builder_source
+CACHE_VERSION = 1
+
+
+def natural_composition(elements, percent_type='ao'):
+    """
+    elements: {element symbol: fraction}, fractions by atom ('ao') or
+    weight ('wo')
+
+    returns: nuclide names and normalized atom fractions (numpy array), with
+    every element expanded to its natural isotopes
+    """
+    names = []
+    fractions = []
+    for symbol, fraction in elements.items():
+        isotopes = openmc.data.isotopes(symbol)
+        abundance = np.array([a for _, a in isotopes])
+
+        if percent_type == 'wo':
+            masses = np.array([openmc.data.atomic_mass(n) for n, _ in isotopes])
+            # mass of the element -> atoms of each isotope
+            abundance = abundance*fraction/(abundance @ masses)
+        else:
+            abundance = abundance*fraction
+
+        names += [n for n, _ in isotopes]
+        fractions.append(abundance)
+
+    fractions = np.concatenate(fractions)
+    return names, fractions/fractions.sum()
+
+
+def atom_fractions(material):
+    """
+    returns nuclide names and normalized atom fractions of a material
+    """
+    names = [nuc.name for nuc in material.nuclides]
+    fractions = np.array([nuc.percent for nuc in material.nuclides])
+    is_wo = np.array([nuc.percent_type == 'wo' for nuc in material.nuclides])
+
+    masses = np.array([openmc.data.atomic_mass(n) for n in names])
+    fractions = np.where(is_wo, fractions/masses, fractions)
+
+    return names, fractions/fractions.sum()
+
+
+def make_material(names, fractions, density, name=None, material_id=None):
+    """
+    returns an openmc material from nuclide atom fractions and a density in
+    g/cm3, material_id is left to openmc if None
+    """
+    material = openmc.Material(material_id=material_id, name=name)
+    for nuclide, fraction in zip(names, fractions):
+        material.add_nuclide(nuclide, float(fraction), 'ao')
+    material.set_density('g/cm3', density)
+    return material
+
+
+def from_atom_frac(components, density, name=None):
+    """
+    components: {material: number of formula units}, e.g. {Zr: 1, C: 1} for
+    ZrC, each material counts as one atom per formula unit
+
+    returns: the combined material at the given density
+    """
+    totals = {}
+    for material, count in components.items():
+        names, fractions = atom_fractions(material)
+        for nuclide, fraction in zip(names, count*fractions):
+            totals[nuclide] = totals.get(nuclide, 0) + fraction
+
+    fractions = np.array(list(totals.values()))
+    return make_material(list(totals), fractions/fractions.sum(), density, name)
+
+
+def mix(components, percent_type, name=None, material_id=None):
+    """
+    components: {material: fraction}, fractions are normalized
+    material_id: id of the mixture, left to openmc if None
+
+    returns: openmc.Material.mix_materials of the components, by weight
+    ('wo') the density assumes additive volumes, by volume ('vo') it is the
+    volume weighted density
+    """
+    materials = list(components)
+    fractions = np.array(list(components.values()), dtype=float)
+
+    return openmc.Material.mix_materials(materials,
+                                         list(fractions/fractions.sum()),
+                                         percent_type, name=name,
+                                         material_id=material_id)
+
+
 def carbon():
-    nucvec = {60000000: 1}
-    C = Material(nucvec)
-    C.density = 2.1  # g/cm3, from taub, slightly lower than crystalline
-    C = C.expand_elements()
-    C.metadata['mat_number'] = 1
-    return C
+    names, fractions = natural_composition({'C': 1})
+    return make_material(names, fractions, 2.1, 'C')  # g/cm3, from taub, slightly lower than crystalline
 
 
 def zirconium():
-    nucvec = {400000: 1}
-    Zr = Material(nucvec)
-    Zr = Zr.expand_elements()
-    Zr.density = 6.49  # g/cm3
-    Zr.metadata['mat_number'] = 2
-    return (Zr)
+    names, fractions = natural_composition({'Zr': 1})
+    return make_material(names, fractions, 6.49, 'Zr')  # g/cm3
 
 
 def hydrogen_STP():
-    nucvec = {10000: 1}
-    H = Material(nucvec)
-    H = H.expand_elements()
-    H.density = 8.988e-5
-    H.metadata['mat_number'] = 9
-    return H
+    names, fractions = natural_composition({'H': 1})
+    return make_material(names, fractions, 8.988e-5, 'H')
 
 
 def uranium(enrichment):
-    U = Material({'U238': 1-enrichment, 'U235': enrichment})  # mass enrichment
-    U.density = 19.1  # g/cm3
-    U.metadata['mat_number'] = 3
+    U = openmc.Material(name='U')
+    U.add_nuclide('U238', 1-enrichment, 'wo')  # mass enrichment
+    U.add_nuclide('U235', enrichment, 'wo')
+    U.set_density('g/cm3', 19.1)
     return U
 
 def beryllium():
-    nucvec = {40000: 1}
-    Be = Material(nucvec)
-    Be = Be.expand_elements()
-    Be.density = 1.85 #g/cm3
-    Be.metadata['mat_number'] = 11
-    return Be
+    names, fractions = natural_composition({'Be': 1})
+    return make_material(names, fractions, 1.85, 'Be') #g/cm3
 
 def copper():
-    nucvec = {290000: 1}
-    Cu = Material(nucvec)
-    Cu = Cu.expand_elements()
-    Cu.density = 8.96 #g/cm3
-    Cu.metadata['mat_number'] = 12
-    return Cu
+    names, fractions = natural_composition({'Cu': 1})
+    return make_material(names, fractions, 8.96, 'Cu') #g/cm3
 
 def boron():
-    nucvec = {50000: 1}
-    B = Material(nucvec)
-    B = B.expand_elements()
-    B.density = 2.3 #g/cm3
-    B.metadata['mat_number'] = 13
-    return B
+    names, fractions = natural_composition({'B': 1})
+    return make_material(names, fractions, 2.3, 'B') #g/cm3
 
 def copper_boron(Cu, B, C):
-    
-    # ref https://www.osti.gov/servlets/purl/1067489
-    B4C = Material()
-    B4C.from_atom_frac({B:4,C:1})
-    B4C.density = 2.5 #g/cm3
 
-    mix = MultiMaterial({Cu:0.5, B4C:0.5})
+    # ref https://www.osti.gov/servlets/purl/1067489
+    B4C = from_atom_frac({B: 4, C: 1}, 2.5, 'B4C') #g/cm3
 
-    CuB = mix.mix_by_volume()
-    CuB.metadata['mat_number'] = 14
+    CuB = mix({Cu: 0.5, B4C: 0.5}, 'vo', 'CuB')
 
     return CuB
 
 
 def uranium_carbide(U, C):
-    UC = Material()
-    UC.from_atom_frac({U: 1, C: 1})
-    UC.density = 13.60  # g/cm3 from taub
-    UC.metadata['mat_number'] = 4
+    UC = from_atom_frac({U: 1, C: 1}, 13.60, 'UC')  # g/cm3 from taub
     return UC
 
 
 def zirconium_carbide(Zr, C):
-    ZrC = Material()
-    ZrC.from_atom_frac({Zr: 1, C: 1})
-    ZrC.density = 6.59  # g/cm3 from taub
-    ZrC.metadata['mat_number'] = 5
+    ZrC = from_atom_frac({Zr: 1, C: 1}, 6.59, 'ZrC')  # g/cm3 from taub
     return ZrC
 
 
@@ -106,60 +174,50 @@ def zirconium_hydride_II():
     Zr = zirconium()
     H = hydrogen_STP()
 
-    ZrH2 = Material()
-    ZrH2.from_atom_frac({Zr: 1, H: 2})
-    ZrH2.density = 5.60  # g/cm3
-    ZrH2.metadata['mat_number'] = 7
+    ZrH2 = from_atom_frac({Zr: 1, H: 2}, 5.60, 'ZrH2')  # g/cm3
 
     return ZrH2
 
 
 def inconel_718():
     #composition from wikipedia, impurities omitted, balance Fe
-    nucvec = {280000: 52.5, 240000: 19, 420000: 3,
-              410000: 2.5, 730000: 2.5, 130000: 0.6, 220000: 0.9, 260000: 19}
-    inconel = Material(nucvec)
-    inconel = inconel.expand_elements()
-    inconel.density = 8.22 #g/cm3
-    inconel.metadata['mat_number'] = 8
-    return inconel
+    wo = {'Ni': 52.5, 'Cr': 19, 'Mo': 3, 'Nb': 2.5, 'Ta': 2.5, 'Al': 0.6,
+          'Ti': 0.9, 'Fe': 19}
+    names, fractions = natural_composition(wo, 'wo')
+    return make_material(names, fractions, 8.22, 'inconel') #g/cm3
 
 def zirconium_carbide_insulator(ZrC):
-    mix = MultiMaterial({ZrC:1})
-    insulator = mix.mix_by_volume()
-    insulator.density = ZrC.density/2
-    insulator.metadata['mat_number'] = 10
+    insulator = mix({ZrC: 1}, 'vo', 'ZrC_insulator')
+    insulator.set_density('g/cm3', ZrC.get_mass_density()/2)
     return insulator
 
 def SS316LN_mat():
-    nucvec = {50000000:0.030, 
-              60000000:0.030, 
-              70000000:0.160, 
-              140000000:1.0, 
-              150000000:0.030, 
-              160000000:0.020, 
-              240000000:17.250, 
-              250000000:2.00 , 
-              260000000:64.830, 
-              270000000:0.100, 
-              280000000:12.00, 
-              410000000:0.050, 
-              420000000:2.5}
-    
-    SS316LN = Material(nucvec)
-    SS316LN.density = 7.93
-    SS316LN=SS316LN.expand_elements()
-    SS316LN.metadata['citation']='GilbertHandbookITERCCFE_2016'
-    SS316LN.metadata['mat_number'] = 15
-    return SS316LN
-
-def mix_UZrC_graphite(ZrC_wo, UC_wo, C_wo, void_percent, mat_number,
+    # GilbertHandbookITERCCFE_2016, weight percent
+    wo = {'B': 0.030,
+          'C': 0.030,
+          'N': 0.160,
+          'Si': 1.0,
+          'P': 0.030,
+          'S': 0.020,
+          'Cr': 17.250,
+          'Mn': 2.00,
+          'Fe': 64.830,
+          'Co': 0.100,
+          'Ni': 12.00,
+          'Nb': 0.050,
+          'Mo': 2.5}
+
+    names, fractions = natural_composition(wo, 'wo')
+    return make_material(names, fractions, 7.93, 'SS316LN')
+
+def mix_UZrC_graphite(ZrC_wo, UC_wo, C_wo, void_percent, mat_number=None,
                       U_enrichment=0.93):
     """
     UC_wo: weight percent UC
     ZrC_wo: weight percent ZrC
     C_wo: free carbon (graphite) weight percent
     void_percent: desired void percent
+    mat_number: material id, left to openmc if None
     U_enrichment: percent U235, 0.93 default from taub
 
     returns: material object, mix the materials by weight, then scale density
@@ -172,76 +230,282 @@ def mix_UZrC_graphite(ZrC_wo, UC_wo, C_wo, void_percent, mat_number,
     ZrC = zirconium_carbide(Zr, C)
     UC = uranium_carbide(U, C)
 
-    mix = MultiMaterial({ZrC: ZrC_wo, UC: UC_wo, C: C_wo})
-    UZrC_graphite = mix.mix_by_mass()
+    UZrC_graphite = mix({ZrC: ZrC_wo, UC: UC_wo, C: C_wo}, 'wo', 'UZrC_graphite',
+                        mat_number)
 
-    UZrC_graphite.density = UZrC_graphite.density*(1-void_percent)
-    UZrC_graphite.metadata['mat_number'] = mat_number
+    UZrC_graphite.set_density('g/cm3',
+                              UZrC_graphite.get_mass_density()*(1-void_percent))
 
     return UZrC_graphite
 
 
+def UZrC_graphite_design_space(ZrC_wo, UC_wo, C_wo, void_percent,
+                               U_enrichment=0.93):
+    """
+    vectorized mix_UZrC_graphite for fuel loading and enrichment studies,
+    every argument is an array of variants (scalars are broadcast), with the
+    same meaning as in mix_UZrC_graphite
+
+    returns: a columnar table (dict of numpy arrays, one row per variant)
+    with the inputs, 'density' in g/cm3 and the atom density of every
+    nuclide in atoms/b-cm
+    """
+    ZrC_wo, UC_wo, C_wo, void_percent, U_enrichment = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in
+          (ZrC_wo, UC_wo, C_wo, void_percent, U_enrichment)))
+
+    # constituent densities and natural compositions from the scalar builders
+    C_density = carbon().get_mass_density()
+    ZrC_density = zirconium_carbide(zirconium(), carbon()).get_mass_density()
+    UC_density = uranium_carbide(uranium(0.93), carbon()).get_mass_density()
+
+    C_names, C_abundance = natural_composition({'C': 1})
+    Zr_names, Zr_abundance = natural_composition({'Zr': 1})
+    C_mass = C_abundance @ [openmc.data.atomic_mass(n) for n in C_names]
+    Zr_mass = Zr_abundance @ [openmc.data.atomic_mass(n) for n in Zr_names]
+    U235_mass = openmc.data.atomic_mass('U235')
+    U238_mass = openmc.data.atomic_mass('U238')
+
+    # enrichment is by mass, moles of each isotope per gram of uranium
+    U235_moles = U_enrichment/U235_mass
+    U238_moles = (1 - U_enrichment)/U238_mass
+    U_mass = 1/(U235_moles + U238_moles)
+
+    # mix by mass with additive volumes, then take out the void
+    total = ZrC_wo + UC_wo + C_wo
+    w_ZrC, w_UC, w_C = ZrC_wo/total, UC_wo/total, C_wo/total
+    density = (1 - void_percent)/(w_ZrC/ZrC_density + w_UC/UC_density +
+                                  w_C/C_density)
+
+    # moles of formula units (ZrC, UC) and free carbon atoms per cm3
+    ZrC_moles = density*w_ZrC/(Zr_mass + C_mass)
+    UC_moles = density*w_UC/(U_mass + C_mass)
+    C_moles = ZrC_moles + UC_moles + density*w_C/C_mass
+
+    to_atom_density = openmc.data.AVOGADRO*1e-24
+    table = {'ZrC_wo': ZrC_wo, 'UC_wo': UC_wo, 'C_wo': C_wo,
+             'void_percent': void_percent, 'U_enrichment': U_enrichment,
+             'density': density}
+    for name, abundance in zip(C_names, C_abundance):
+        table[name] = C_moles*abundance*to_atom_density
+    for name, abundance in zip(Zr_names, Zr_abundance):
+        table[name] = ZrC_moles*abundance*to_atom_density
+    table['U235'] = UC_moles*U235_moles*U_mass*to_atom_density
+    table['U238'] = UC_moles*U238_moles*U_mass*to_atom_density
+
+    return table
+
+
+def design_space_materials(table, rows=None, name='graphite_fuel_variant'):
+    """
+    returns openmc.Materials for the given rows (all by default) of a
+    UZrC_graphite_design_space table, named name_<row>
+    """
+    inputs = {'ZrC_wo', 'UC_wo', 'C_wo', 'void_percent', 'U_enrichment',
+              'density'}
+    nuclides = [n for n in table if n not in inputs]
+    atom_densities = np.column_stack([table[n] for n in nuclides])
+
+    if rows is None:
+        rows = range(atom_densities.shape[0])
+
+    materials = openmc.Materials()
+    for row in rows:
+        material = openmc.Material(name=f'{name}_{row}')
+        for nuclide, atom_density in zip(nuclides, atom_densities[row]):
+            material.add_nuclide(nuclide, atom_density, 'ao')
+        material.set_density('atom/b-cm', atom_densities[row].sum())
+        materials.append(material)
+
+    return materials
+
+
+def recipes():
+    """
+    returns (name, mat_number, parameters, build) for every material in
+    materials.xml, build(**parameters) returns the material and the
+    parameters are what the cache is keyed on
+    """
+    def graphite_fuel(ZrC_wo, UC_wo, C_wo, void_percent, U_enrichment):
+        return mix_UZrC_graphite(ZrC_wo, UC_wo, C_wo, void_percent,
+                                 U_enrichment=U_enrichment)
+
+    def fuel(ZrC_wo, UC_wo, C_wo, void_percent, U_enrichment=0.93):
+        return dict(ZrC_wo=ZrC_wo, UC_wo=UC_wo, C_wo=C_wo,
+                    void_percent=void_percent, U_enrichment=U_enrichment)
+
+    return [
+        ('graphite_carbon', 1, {}, carbon),
+        ('Zirconium', 2, {}, zirconium),
+        ('zirconium_carbide', 5, {},
+         lambda: zirconium_carbide(zirconium(), carbon())),
+        ('Uranium_cabide_0.93', 4, {'U_enrichment': 0.93},
+         lambda U_enrichment: uranium_carbide(uranium(U_enrichment), carbon())),
+        # these numbers correspond to headers in taub table 6
+        ('graphite_fuel_70U_15C', 6, fuel(38.4, 2.8, 58.5, 0.117), graphite_fuel),
+        #the numbers in the table add up to more than 100% for this one
+        #so i reduced the free carbon percentage because that makes sense
+        ('graphite_fuel_70U_20C', 16, fuel(46.1, 2.7, 51.2, 0.114), graphite_fuel),
+        ('graphite_fuel_70U_30C', 17, fuel(59.7, 2.4, 37.7, 0.113), graphite_fuel),
+        ('graphite_fuel_435U_30C', 18, fuel(52.7, 13.1, 33.7, 0.155), graphite_fuel),
+        ('graphite_fuel_435U_35C', 19, fuel(57.7, 12.6, 29.2, 0.150), graphite_fuel),
+        ('graphite_fuel_435U_40C', 20, fuel(63.4, 11.8, 24.7, 0.135), graphite_fuel),
+        ('graphite_fuel_435U_45C', 21, fuel(67.6, 11.2, 20.8, 0.140), graphite_fuel),
+        ('zirconium_hydride_II', 7, {}, zirconium_hydride_II),
+        ('inconel-718', 8, {}, inconel_718),
+        ('Hydrogen STP', 9, {}, hydrogen_STP),
+        ('zirconium_carbide_insulator', 10, {},
+         lambda: zirconium_carbide_insulator(zirconium_carbide(zirconium(),
+                                                               carbon()))),
+        ('Beryllium', 11, {}, beryllium),
+        ('copper_boron', 14, {}, lambda: copper_boron(copper(), boron(), carbon())),
+        ('SS316L', 15, {}, SS316LN_mat),
+    ]
+
+
+def builder_source(build):
+    """
+    returns the source of build and of every function of this module it
+    calls, directly or through other functions, so edited densities and
+    compositions change the hash
+    """
+    sources = {}
+    stack = [build]
+    while stack:
+        function = stack.pop()
+        if function in sources:
+            continue
+        sources[function] = inspect.getsource(function)
+
+        codes = [function.__code__]
+        while codes:
+            code = codes.pop()
+            codes.extend(c for c in code.co_consts if inspect.iscode(c))
+            for name in code.co_names:
+                called = globals().get(name)
+                if inspect.isfunction(called) and called.__module__ == __name__:
+                    stack.append(called)
+
+    return sorted(sources.values())
+
+
+def recipe_hash(name, mat_number, parameters, build):
+    """
+    content hash of everything a cached material depends on
+    """
+    key = json.dumps([CACHE_VERSION, name, mat_number, parameters,
+                      builder_source(build)], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def build_library(cache_file='materials_cache.json'):
+    """
+    returns openmc.Materials for every recipe, reusing cached compositions
+    whose content hash didn't change, and the names that were recomputed
+    """
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    recomputed = []
+    for name, mat_number, parameters, build in recipes():
+        content_hash = recipe_hash(name, mat_number, parameters, build)
+        if cache.get(name, {}).get('hash') == content_hash:
+            continue
+
+        material = build(**parameters)
+        names, fractions = atom_fractions(material)
+        cache[name] = {'hash': content_hash,
+                       'id': mat_number,
+                       'density': material.get_mass_density(),
+                       'nuclides': [[n, float(f)] for n, f in zip(names, fractions)]}
+        recomputed.append(name)
+
+    if recomputed:
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent=1)
+
+    # the throwaway materials above used up ids, the library sets its own
+    openmc.reset_auto_ids()
+
+    library = openmc.Materials()
+    for name, mat_number, _, _ in recipes():
+        entry = cache[name]
+        material = make_material([n for n, _ in entry['nuclides']],
+                                 [f for _, f in entry['nuclides']],
+                                 entry['density'], name, mat_number)
+        library.append(material)
+
+    return library, recomputed
+
+
+def compare_to_xml(library, path='materials.xml'):
+    """
+    prints the largest density and atom fraction differences between
+    library and the materials in path, returns the largest atom fraction
+    difference
+    """
+    # the reference materials reuse the library ids
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', IDWarning)
+        reference = {m.name: m for m in openmc.Materials.from_xml(path)}
+    largest = 0.0
+
+    for material in library:
+        if material.name not in reference:
+            print(f'{material.name}: not in {path}')
+            continue
+        old = reference[material.name]
+
+        new_ao = dict(zip(*atom_fractions(material)))
+        old_ao = dict(zip(*atom_fractions(old)))
+        diff = max(abs(new_ao.get(n, 0) - old_ao.get(n, 0))
+                   for n in set(new_ao) | set(old_ao))
+        density_diff = (material.get_mass_density()/old.get_mass_density()) - 1
+
+        largest = max(largest, diff)
+        print(f'{material.name}: density {density_diff:+.2e} relative, '
+              f'largest atom fraction difference {diff:.2e}')
+
+    return largest
+
+
+def write_if_changed(library, path='materials.xml'):
+    """
+    exports library to path, leaving the file untouched if nothing changed
+    returns True if the file was written
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        new_path = os.path.join(tmp, 'materials.xml')
+        library.export_to_xml(new_path)
+
+        with open(new_path, 'rb') as f:
+            new = f.read()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read() == new:
+                    return False
+
+        os.replace(new_path, path)
+    return True
+
+
 def main():
 
-    # get the material objects
-    C = carbon()
-    Zr = zirconium()
-    U = uranium(0.93)
-    Be = beryllium()
-    Cu = copper()
-    B = boron()
-    ZrC = zirconium_carbide(Zr, C)
-    UC = uranium_carbide(U, C)
-    UZrC70_15 = mix_UZrC_graphite(38.4, 2.8, 58.5, 0.117,6)
-    #the numbers in the table add up to more than 100% for this one
-    #so i reduced the free carbon percentage because that makes sense
-    UZrC70_20 = mix_UZrC_graphite(46.1, 2.7, 51.2, 0.114, 16) 
-    UZrC70_30 = mix_UZrC_graphite(59.7, 2.4, 37.7, 0.113, 17)
-    UZrC435_30 = mix_UZrC_graphite(52.7, 13.1, 33.7, 0.155, 18)
-    UZrC435_35 = mix_UZrC_graphite(57.7, 12.6, 29.2, 0.150, 19)
-    UZrC435_40 = mix_UZrC_graphite(63.4, 11.8, 24.7, 0.135, 20)
-    UZrC435_45 = mix_UZrC_graphite(67.6, 11.2, 20.8, 0.140, 21)
-    ZrH2 = zirconium_hydride_II()
-    Inc_718 = inconel_718()
-    H_STP = hydrogen_STP()
-    ZrC_insulator = zirconium_carbide_insulator(ZrC)
-    CuB = copper_boron(Cu, B, C)
-    ss316l = SS316LN_mat()
-
-    # print em out and have a look
-    print(C)
-    print(Zr)
-    print(U)
-    print(ZrC)
-    print(UC)
-    print(UZrC70_15)
-    print(ZrH2)
-    print(Inc_718)
-    print(H_STP)
-
-    # make the library and export to xml
-    lib = MaterialLibrary()
-    lib['graphite_carbon'] = C
-    lib['Zirconium'] = Zr
-    lib['zirconium_carbide'] = ZrC
-    lib['Uranium_cabide_0.93'] = UC
-    # these numbers correspond to headers in taub table 6
-    lib['graphite_fuel_70U_15C'] = UZrC70_15
-    lib['graphite_fuel_70U_20C'] = UZrC70_20
-    lib['graphite_fuel_70U_30C'] = UZrC70_30
-    lib['graphite_fuel_435U_30C'] = UZrC435_30
-    lib['graphite_fuel_435U_35C'] = UZrC435_35
-    lib['graphite_fuel_435U_40C'] = UZrC435_40
-    lib['graphite_fuel_435U_45C'] = UZrC435_45
-    lib['graphite_fuel_']
-    lib['zirconium_hydride_II'] = ZrH2
-    lib['inconel-718'] = Inc_718
-    lib['Hydrogen STP'] = H_STP
-    lib['zirconium_carbide_insulator'] = ZrC_insulator
-    lib['Beryllium'] = Be
-    lib['copper_boron'] = CuB
-    lib['SS316L'] = ss316l
-    lib.write_openmc('materials.xml')
+    library, recomputed = build_library()
+    print(f"recomputed: {', '.join(recomputed) if recomputed else 'nothing'}")
+
+    # the pyne built SS316L is missing C12, N14, P31, S32, Mn55, Fe54,
+    # Co59, Ni58 and Mo92, so it will differ from the old materials.xml
+    if os.path.exists('materials.xml'):
+        compare_to_xml(library)
+
+    if write_if_changed(library):
+        print('wrote materials.xml')
+    else:
+        print('materials.xml is up to date')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,266 @@
+"""
+Multigroup cross section library for fast scoping runs.
+
+One continuous energy reference run of get_model() tallies 56 group
+macroscopic cross sections for every material in the core and for every
+fuel element (distribcell instance of 'fuel_element'). The library is
+written to an MGXS HDF5 file that get_model(..., mgxs_file=...) uses to run
+the same core in multi-group mode, and every multigroup run is compared to
+the reference k-eff and fuel element power map.
+"""
+
+import argparse
+import json
+import os
+
+import h5py
+import numpy as np
+import openmc
+import openmc.mgxs
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+mgxs_types = ['total', 'absorption', 'fission', 'nu-fission', 'kappa-fission',
+              'chi', 'nu-scatter matrix', 'multiplicity matrix']
+
+
+def heating_tally(geometry):
+    """
+    per fuel element kappa-fission tally, scored the same way in the
+    continuous energy and multigroup runs so the power maps compare
+    """
+    fuel_cell = gd.get_cell(geometry, 'fuel_element')
+    tally = openmc.Tally(name='Heating')
+    tally.filters = [openmc.DistribcellFilter(fuel_cell)]
+    tally.scores = ['kappa-fission']
+    return tally
+
+
+def build_libraries(geometry, legendre_order=3, element_domains=True):
+    """
+    returns the openmc.mgxs libraries to tally: one over every material in
+    geometry and, with element_domains, one over every fuel element
+    """
+    groups = openmc.mgxs.EnergyGroups(gd.energy_bins)
+    geometry.determine_paths()
+
+    domains = [('material', list(geometry.get_all_materials().values()))]
+    if element_domains:
+        domains.append(('distribcell', [gd.get_cell(geometry, 'fuel_element')]))
+
+    libraries = []
+    for domain_type, domain in domains:
+        library = openmc.mgxs.Library(geometry)
+        library.energy_groups = groups
+        library.mgxs_types = mgxs_types
+        library.correction = None
+        library.legendre_order = legendre_order
+        library.by_nuclide = False
+        library.domain_type = domain_type
+        library.domains = domain
+        library.build_library()
+        libraries.append(library)
+
+    return libraries
+
+
+def reference_model(height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+                    particles=100_000, batches=100, inactive=30,
+                    temperature=2500, legendre_order=3, element_domains=True):
+    """
+    returns the continuous energy model with the library and heating
+    tallies, and the libraries to load its statepoint into
+    """
+    model = gd.get_model(height, clocking, graphite_fuel)
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': temperature}
+
+    libraries = build_libraries(model.geometry, legendre_order, element_domains)
+
+    tallies = openmc.Tallies([heating_tally(model.geometry)])
+    for library in libraries:
+        library.add_to_tallies_file(tallies, merge=True)
+    model.tallies = tallies
+
+    return model, libraries
+
+
+def write_mgxs_file(libraries, statepoint, path, temperature=2500):
+    """
+    loads the library tallies from the reference statepoint and writes the
+    macroscopic cross sections of every material (named after the material)
+    and fuel element (fuel_element_<instance>) to an MGXS HDF5 file
+    """
+    groups = libraries[0].energy_groups
+    mgxs_file = openmc.MGXSLibrary(groups)
+
+    with openmc.StatePoint(statepoint) as sp:
+        for library in libraries:
+            library.load_from_statepoint(sp)
+
+            for domain in library.domains:
+                if library.domain_type == 'distribcell':
+                    names = [(f'{domain.name}_{i}', i)
+                             for i in range(domain.num_instances)]
+                else:
+                    names = [(domain.name, None)]
+
+                for name, subdomain in names:
+                    xsdata = library.get_xsdata(domain, name, subdomain=subdomain)
+                    # the data is stored at one temperature, label it with the
+                    # temperature of the reference run so runs at that
+                    # temperature find it
+                    xsdata.temperatures = [temperature]
+                    mgxs_file.add_xsdata(xsdata)
+
+    mgxs_file.export_to_hdf5(path)
+
+
+def generate(height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+             directory='mgxs_reference', mgxs_file='mgxs.h5',
+             particles=100_000, batches=100, inactive=30, temperature=2500,
+             legendre_order=3, element_domains=True):
+    """
+    runs the continuous energy reference and writes the library to
+    directory/mgxs_file, returns the path of the library
+    """
+    model, libraries = reference_model(height, clocking, graphite_fuel,
+                                       particles, batches, inactive,
+                                       temperature, legendre_order,
+                                       element_domains)
+
+    os.makedirs(directory, exist_ok=True)
+    statepoint = model.run(cwd=directory)
+
+    path = os.path.join(directory, mgxs_file)
+    write_mgxs_file(libraries, statepoint, path, temperature)
+
+    # what the library was made from, for the bias report and later runs
+    reference = {'height': height, 'clocking': clocking,
+                 'graphite_fuel': graphite_fuel, 'temperature': temperature,
+                 'statepoint': os.path.abspath(statepoint),
+                 'element_domains': element_domains}
+    with open(os.path.join(directory, 'reference.json'), 'w') as f:
+        json.dump(reference, f, indent=2)
+
+    return path
+
+
+def run_multigroup(mgxs_file, height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+                   directory='mgxs_run', particles=100_000, batches=100,
+                   inactive=30, temperature=2500):
+    """
+    runs get_model in multi-group mode with the heating tally, returns the
+    statepoint path
+    """
+    model = gd.get_model(height, clocking, graphite_fuel,
+                         mgxs_file=os.path.abspath(mgxs_file))
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': temperature}
+    model.tallies = [heating_tally(model.geometry)]
+
+    os.makedirs(directory, exist_ok=True)
+    return model.run(cwd=directory)
+
+
+def element_power(statepoint):
+    """
+    returns k-eff [mean, std dev] and the per fuel element power fraction
+    and its std dev
+    """
+    with h5py.File(statepoint, 'r') as f:
+        keff = f['k_combined'][()]
+        heat = pp.reduce_tally(f, 'Heating')
+
+    total = heat['mean'].sum()
+    return keff, heat['mean']/total, heat['std_dev']/total
+
+
+def bias_report(ce_statepoint, mg_statepoint):
+    """
+    prints and returns the multigroup minus continuous energy k-eff bias in
+    pcm and the fuel element power map differences
+    """
+    ce_keff, ce_power, ce_std = element_power(ce_statepoint)
+    mg_keff, mg_power, mg_std = element_power(mg_statepoint)
+
+    bias = {'keff_ce': ce_keff.tolist(), 'keff_mg': mg_keff.tolist(),
+            'keff_bias_pcm': 1e5*(mg_keff[0] - ce_keff[0]),
+            'keff_bias_std_pcm': 1e5*np.hypot(mg_keff[1], ce_keff[1])}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_diff = np.where(ce_power > 0, mg_power/ce_power - 1, 0)
+        # differences in units of their combined statistical uncertainty
+        n_sigma = np.where(ce_power > 0, (mg_power - ce_power)/np.hypot(mg_std, ce_std), 0)
+
+    bias['power_max_rel_diff'] = float(np.abs(rel_diff).max())
+    bias['power_rms_rel_diff'] = float(np.sqrt(np.mean(rel_diff**2)))
+    bias['power_max_element'] = int(np.abs(rel_diff).argmax())
+    bias['power_over_3_sigma'] = int(np.sum(np.abs(n_sigma) > 3))
+
+    print(f"k-eff CE {ce_keff[0]:.5f} +/- {ce_keff[1]:.5f}, "
+          f"MG {mg_keff[0]:.5f} +/- {mg_keff[1]:.5f}, bias "
+          f"{bias['keff_bias_pcm']:.0f} +/- {bias['keff_bias_std_pcm']:.0f} pcm")
+    print(f"element power MG/CE - 1: max {bias['power_max_rel_diff']:.4f} "
+          f"(element {bias['power_max_element']}), rms "
+          f"{bias['power_rms_rel_diff']:.4f}, {bias['power_over_3_sigma']} of "
+          f"{ce_power.size} elements differ by more than 3 sigma")
+
+    return bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--directory', default='mgxs_reference')
+    parser.add_argument('--particles', type=int, default=100_000)
+    parser.add_argument('--no-element-domains', action='store_true',
+                        help='only tally cross sections per material')
+    parser.add_argument('--regenerate', action='store_true',
+                        help='rerun the reference even if the library exists')
+    parser.add_argument('--angles', nargs='*', type=float, default=[],
+                        help='extra drum angles to scope in multi-group mode')
+    args = parser.parse_args()
+
+    mgxs_file = os.path.join(args.directory, 'mgxs.h5')
+    if args.regenerate or not os.path.exists(mgxs_file):
+        generate(args.height, args.clocking, args.fuel, args.directory,
+                 particles=args.particles,
+                 element_domains=not args.no_element_domains)
+
+    with open(os.path.join(args.directory, 'reference.json')) as f:
+        reference = json.load(f)
+
+    # multigroup run at the reference conditions, for the bias
+    statepoint = run_multigroup(mgxs_file, reference['height'],
+                                reference['clocking'],
+                                reference['graphite_fuel'],
+                                os.path.join(args.directory, 'mg_reference'),
+                                particles=args.particles,
+                                temperature=reference['temperature'])
+    bias = bias_report(reference['statepoint'], statepoint)
+    with open(os.path.join(args.directory, 'bias.json'), 'w') as f:
+        json.dump(bias, f, indent=2)
+
+    for angle in args.angles:
+        statepoint = run_multigroup(mgxs_file, args.height, angle, args.fuel,
+                                    os.path.join(args.directory, f'mg_{angle:g}'),
+                                    particles=args.particles,
+                                    temperature=reference['temperature'])
+        with openmc.StatePoint(statepoint) as sp:
+            keff = sp.keff
+        print(f'drum angle {angle:g}: MG k-eff {keff.nominal_value:.5f} '
+              f'+/- {keff.std_dev:.5f} (bias corrected '
+              f"{keff.nominal_value - bias['keff_bias_pcm']*1e-5:.5f})")
+
+
+if __name__ == '__main__':
+    main()
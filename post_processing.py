@@ -0,0 +1,196 @@
+"""
+Streaming reduction of statepoint files.
+
+Reads tally results straight from the statepoint HDF5 in chunks of the first
+filter (the fuel element distribcell filter for the fuel tallies), so the
+full 56 group x every fuel element arrays are never held in memory. Writes
+per element power, peaking factor, group collapsed flux and relative errors
+to a compact NPZ (or Parquet if pandas/pyarrow are available).
+"""
+
+import argparse
+import os
+
+import h5py
+import numpy as np
+
+
+# some constants, same as post_processing_first_run.ipynb
+thermal_power = 354e6 #watts, J/s
+
+
+def tally_group(f, name):
+    """
+    returns the HDF5 group of the tally with a matching name
+    """
+    tallies = f['tallies']
+    for tally_id in tallies.attrs['ids']:
+        group = tallies[f'tally {tally_id}']
+        if 'name' in group and group['name'][()].decode() == name:
+            return group
+
+    raise KeyError(f'no tally named {name} in {f.filename}')
+
+
+def filter_bins(f, group):
+    """
+    returns the number of bins of each filter of a tally, slowest varying
+    first
+    """
+    if group['n_filters'][()] == 0:
+        return []
+
+    filters = f['tallies/filters']
+    return [int(filters[f'filter {i}']['n_bins'][()])
+            for i in group['filters'][()]]
+
+
+def tally_chunks(group, rows_per_chunk):
+    """
+    yields (first row, mean, std_dev) for consecutive chunks of filter bins,
+    mean and std_dev have shape (rows, nuclides*scores)
+    """
+    results = group['results']
+    n = group['n_realizations'][()]
+
+    for start in range(0, results.shape[0], rows_per_chunk):
+        data = results[start:start + rows_per_chunk]
+        mean = data[..., 0]/n
+        variance = np.maximum(data[..., 1]/n - mean**2, 0)/max(n - 1, 1)
+        yield start, mean, np.sqrt(variance)
+
+
+def reduce_tally(f, name, chunk_size=64):
+    """
+    reduces a tally over everything but its first filter, chunk_size first
+    filter bins (e.g. fuel elements) are read at a time
+
+    returns a dict with per first filter bin 'mean' (summed over the other
+    filters and scores), 'std_dev' (other bins assumed independent) and
+    'max_rel_err' (largest relative error of any nonzero bin), and the
+    overall 'max_rel_err'
+    """
+    group = tally_group(f, name)
+    bins = filter_bins(f, group)
+    n_first = bins[0] if bins else 1
+    inner = int(np.prod(bins[1:])) if len(bins) > 1 else 1
+
+    mean = np.zeros(n_first)
+    variance = np.zeros(n_first)
+    max_rel_err = np.zeros(n_first)
+
+    for start, chunk_mean, chunk_std in tally_chunks(group, chunk_size*inner):
+        first = start//inner
+        n = chunk_mean.shape[0]//inner
+        chunk_mean = chunk_mean.reshape(n, -1)
+        chunk_std = chunk_std.reshape(n, -1)
+
+        mean[first:first + n] = chunk_mean.sum(axis=1)
+        variance[first:first + n] = (chunk_std**2).sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_err = np.where(chunk_mean > 0, chunk_std/chunk_mean, 0)
+        max_rel_err[first:first + n] = rel_err.max(axis=1)
+
+    return {'mean': mean, 'std_dev': np.sqrt(variance),
+            'max_rel_err': max_rel_err,
+            'overall_max_rel_err': max_rel_err.max()}
+
+
+def reduce_statepoint(path, power=thermal_power, heating='Heating',
+                      flux='Flux', axial_flux='Axial Flux Tally',
+                      chunk_size=64, index=None):
+    """
+    returns the reduced results of one statepoint: per element power in
+    watts normalized to power, its relative error, peaking factor, group
+    collapsed element and axial flux, max relative errors, and k-eff
+    index: distribcell index of the fuel elements (see
+    geometry_definitions.distribcell_index), adds the element ring,
+    position, x, y and type
+    """
+    results = {}
+    with h5py.File(path, 'r') as f:
+        results['keff'] = f['k_combined'][()]
+        results['n_batches'] = f['current_batch'][()]
+        results['n_particles'] = f['n_particles'][()]
+
+        heat = reduce_tally(f, heating, chunk_size)
+        total = heat['mean'].sum()
+        results['element_power'] = heat['mean']/total*power
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results['element_power_rel_err'] = np.where(
+                heat['mean'] > 0, heat['std_dev']/heat['mean'], 0)
+        results['peaking_factor'] = (results['element_power'].max()/
+                                     results['element_power'].mean())
+        results['heating_max_rel_err'] = heat['overall_max_rel_err']
+
+        fuel_flux = reduce_tally(f, flux, chunk_size)
+        results['element_flux'] = fuel_flux['mean']
+        results['element_flux_max_rel_err'] = fuel_flux['max_rel_err']
+        results['flux_max_rel_err'] = fuel_flux['overall_max_rel_err']
+
+        if axial_flux is not None:
+            axial = reduce_tally(f, axial_flux, chunk_size)
+            results['axial_flux'] = axial['mean']
+            results['axial_flux_max_rel_err'] = axial['overall_max_rel_err']
+
+    if index is not None:
+        for key in ('ring', 'position', 'x', 'y', 'type'):
+            results[f'element_{key}'] = index[key]
+
+    return results
+
+
+def write_results(results, path):
+    """
+    writes reduced results to .npz, or .parquet (per element columns, other
+    values repeated on every row) if the extension asks for it
+    """
+    if path.endswith('.parquet'):
+        import pandas as pd
+
+        n_elements = results['element_power'].size
+        columns = {key: value for key, value in results.items()
+                   if np.ndim(value) == 1 and len(value) == n_elements}
+        for key, value in results.items():
+            if key not in columns and np.ndim(value) == 0:
+                columns[key] = np.full(n_elements, value)
+        pd.DataFrame(columns).to_parquet(path)
+    else:
+        np.savez_compressed(path, **results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('statepoints', nargs='+')
+    parser.add_argument('--power', type=float, default=thermal_power,
+                        help='thermal power to normalize to in W')
+    parser.add_argument('--format', choices=['npz', 'parquet'], default='npz')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='fuel elements read at a time')
+    parser.add_argument('--index', default=None,
+                        help='distribcell index .npz written with the model')
+    args = parser.parse_args()
+
+    index = None
+    if args.index is not None:
+        # imported here so the reduction itself doesn't need openmc
+        import geometry_definitions as gd
+        index = gd.load_distribcell_index(args.index)
+
+    for statepoint in args.statepoints:
+        results = reduce_statepoint(statepoint, args.power,
+                                    chunk_size=args.chunk_size, index=index)
+        out = f'{os.path.splitext(statepoint)[0]}_reduced.{args.format}'
+        write_results(results, out)
+
+        print(f"{statepoint}: k-eff {results['keff'][0]:.5f} +/- "
+              f"{results['keff'][1]:.5f}, peak element "
+              f"{results['element_power'].max():.4e} W, peaking factor "
+              f"{results['peaking_factor']:.3f}, max rel err heating "
+              f"{results['heating_max_rel_err']:.3f} flux "
+              f"{results['flux_max_rel_err']:.3f} -> {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Element by axial layer power map.
+
+get_model(..., axial_layers=n) stacks the core lattice in n layers, so a
+single DistribcellFilter on the fuel_element cell has exactly one bin per
+fuel element and layer: a 3D power map with no empty bins, unlike a
+distribcell x mesh product. This module builds that tally and maps its bins
+back to the lattice (ring, position) used in core_lattice_SNRE, so
+universes[ring][position] is the element, and the axial layer, with
+geometry_definitions.distribcell_index.
+"""
+
+import argparse
+import os
+
+import h5py
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+def power_tally(geometry, name='Element Axial Power', score='kappa-fission'):
+    """
+    returns the element by axial layer tally, one DistribcellFilter bin per
+    fuel element instance
+    """
+    fuel_cell = gd.get_cell(geometry, 'fuel_element')
+    tally = openmc.Tally(name=name)
+    tally.filters = [openmc.DistribcellFilter(fuel_cell)]
+    tally.scores = [score]
+    return tally
+
+
+def load_power_map(statepoint, index, name='Element Axial Power',
+                   power=pp.thermal_power):
+    """
+    index: distribcell index of the run (gd.distribcell_index or
+    gd.load_distribcell_index)
+
+    returns the index with the per bin 'power' in watts normalized to power
+    and its 'rel_err', plus 'power_map' with shape (elements, layers) and
+    the (ring, position) of each of its rows in 'elements'
+    """
+    with h5py.File(statepoint, 'r') as f:
+        reduced = pp.reduce_tally(f, name)
+
+    layout = dict(index)
+    total = reduced['mean'].sum()
+    layout['power'] = reduced['mean']/total*power
+    with np.errstate(divide='ignore', invalid='ignore'):
+        layout['rel_err'] = np.where(reduced['mean'] > 0,
+                                     reduced['std_dev']/reduced['mean'], 0)
+
+    elements = sorted(set(zip(layout['ring'], layout['position'])))
+    row = {element: n for n, element in enumerate(elements)}
+    n_layers = layout['layer'].max() + 1
+
+    power_map = np.zeros((len(elements), n_layers))
+    rows = [row[element] for element in zip(layout['ring'], layout['position'])]
+    power_map[rows, layout['layer']] = layout['power']
+
+    layout['power_map'] = power_map
+    layout['elements'] = np.array(elements)
+    return layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('statepoint')
+    parser.add_argument('--index', default='distribcell_index.npz',
+                        help='distribcell index written with the model')
+    parser.add_argument('--summary', default='summary.h5',
+                        help='summary.h5 of the run, used if there is no index')
+    parser.add_argument('--power', type=float, default=pp.thermal_power)
+    parser.add_argument('--output', default='power_map.npz')
+    args = parser.parse_args()
+
+    if os.path.exists(args.index):
+        index = gd.load_distribcell_index(args.index)
+    else:
+        index = gd.distribcell_index(openmc.Summary(args.summary).geometry)
+    result = load_power_map(args.statepoint, index, power=args.power)
+
+    power_map = result['power_map']
+    peak = np.unravel_index(power_map.argmax(), power_map.shape)
+    ring, position = result['elements'][peak[0]]
+    print(f'{power_map.shape[0]} elements x {power_map.shape[1]} layers, peak '
+          f'{power_map.max():.4e} W at ring {ring} position {position} layer '
+          f'{peak[1]}, 3D peaking factor {power_map.max()/power_map.mean():.3f}, '
+          f"max rel err {result['rel_err'].max():.3f}")
+
+    np.savez_compressed(args.output, **result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Resumable runs: restart from the latest valid statepoint and extend
+finished runs.
+
+A run directory holds one model, identified by a hash of its XML with the
+batch count, statepoint and trigger settings left out, so the same model
+can be continued with more batches. Statepoints are written every interval
+batches and a manifest (manifest.json) records the ones that completed, so
+an interrupted job loses at most one interval: running the manager again
+restarts openmc from the latest valid statepoint. extend=N continues a
+finished run by N more active batches.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+import h5py
+import openmc
+
+
+# settings that may change between a run and its continuation
+restart_settings = ('batches', 'state_point', 'source_point', 'trigger')
+
+
+def model_hash(model):
+    """
+    returns a hash of the model XML without the settings in restart_settings
+
+    the XML holds the cell, surface and material ids, and auto assigned ids
+    depend on what else the Python session built first, so the same model
+    built in another session can hash differently (run() then refuses to
+    restart rather than mixing models). Load the model from model.xml, as
+    main() does, to get stable ids
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        model.export_to_xml(directory)
+
+        digest = hashlib.sha256()
+        for name in ('materials.xml', 'geometry.xml', 'settings.xml', 'tallies.xml'):
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                continue
+            root = ET.parse(path).getroot()
+            if name == 'settings.xml':
+                for tag in restart_settings:
+                    for element in root.findall(tag):
+                        root.remove(element)
+            digest.update(ET.tostring(root))
+
+    return digest.hexdigest()[:16]
+
+
+def statepoint_batch(path):
+    """
+    returns the batch of a readable statepoint, None if the file is
+    truncated or unreadable (e.g. the job died while writing it)
+    """
+    try:
+        with h5py.File(path, 'r') as f:
+            return int(f['current_batch'][()])
+    except (OSError, KeyError):
+        return None
+
+
+def valid_statepoints(directory):
+    """
+    returns [(batch, path)] of the readable statepoints in directory, by batch
+    """
+    statepoints = []
+    for path in glob.glob(os.path.join(directory, 'statepoint.*.h5')):
+        batch = statepoint_batch(path)
+        if batch is not None:
+            statepoints.append((batch, path))
+    return sorted(statepoints)
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, directory):
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def run(model, directory='run', interval=10, extend=0, threads=None,
+        force=False):
+    """
+    runs model in directory up to model.settings.batches, restarting from
+    the latest valid statepoint of an earlier (interrupted) run of the same
+    model. extend: continue a finished run by this many batches. force:
+    restart from statepoints that have no manifest (not written by run)
+
+    returns the path of the last statepoint
+    """
+    os.makedirs(directory, exist_ok=True)
+    current_hash = model_hash(model)
+    manifest = load_manifest(directory)
+    statepoints = valid_statepoints(directory)
+
+    if manifest is None and statepoints and not force:
+        raise ValueError(f'{directory} holds statepoints without a manifest, '
+                         f'nothing says they are of this model (use force)')
+    if manifest is not None and manifest['model_hash'] != current_hash and statepoints:
+        raise ValueError(f'{directory} holds statepoints of a different model '
+                         f"({manifest['model_hash']}, this one is {current_hash})")
+
+    last_batch, last_statepoint = statepoints[-1] if statepoints else (0, None)
+    target = model.settings.batches
+    if manifest is not None:
+        target = max(target, manifest['target_batches'])
+    if extend:
+        target = max(target, last_batch) + extend
+
+    if last_batch < target:
+        model.settings.batches = target
+        # triggers can run on past target, keep writing statepoints up to
+        # where they stop, on top of the model's own schedule
+        final = target
+        if model.settings.trigger_active:
+            final = max(target, model.settings.trigger_max_batches or 0)
+            model.settings.trigger_max_batches = final
+        schedule = set((model.settings.statepoint or {}).get('batches', []))
+        model.settings.statepoint = {'batches': sorted(
+            schedule | set(range(interval, final + 1, interval)) | {target, final})}
+
+        if last_statepoint is not None:
+            print(f'restarting from batch {last_batch} to {target}')
+            restart_file = os.path.abspath(last_statepoint)
+        else:
+            print(f'starting {target} batches')
+            restart_file = None
+
+        manifest = {'model_hash': current_hash, 'target_batches': target,
+                    'statepoints': [], 'completed': False}
+        save_manifest(manifest, directory)
+
+        model.run(cwd=directory, threads=threads, restart_file=restart_file)
+        statepoints = valid_statepoints(directory)
+
+    manifest = {'model_hash': current_hash, 'target_batches': target,
+                'statepoints': [{'batch': batch, 'path': os.path.basename(path),
+                                 'mtime': os.path.getmtime(path)}
+                                for batch, path in statepoints],
+                'completed': bool(statepoints) and statepoints[-1][0] >= target}
+    save_manifest(manifest, directory)
+
+    return statepoints[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('model', nargs='?', default='model.xml',
+                        help='model.xml to run (e.g. from first_run_model.py)')
+    parser.add_argument('--directory', default='run')
+    parser.add_argument('--interval', type=int, default=10,
+                        help='batches between statepoints')
+    parser.add_argument('--extend', type=int, default=0,
+                        help='active batches to add to a finished run')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--force', action='store_true',
+                        help='restart from statepoints without a manifest')
+    args = parser.parse_args()
+
+    model = openmc.Model.from_model_xml(args.model)
+    statepoint = run(model, args.directory, args.interval, args.extend,
+                     args.threads, args.force)
+
+    manifest = load_manifest(args.directory)
+    status = 'complete' if manifest['completed'] else 'INCOMPLETE'
+    print(f"{statepoint}: {manifest['statepoints'][-1]['batch']} of "
+          f"{manifest['target_batches']} batches ({status})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Fuel density and nuclide density sensitivities from one run.
+
+Adds openmc.TallyDerivative tallies on the fuel material to a model: the
+global nu-fission and absorption (for k-eff) and the per fuel element
+heating and flux, each with a derivative with respect to the fuel density
+and to the density of chosen nuclides (e.g. U235). From one statepoint the
+helper reports dk/drho and the per element d(power)/drho at fixed total
+power, which covers the void fraction and composition questions that used
+to need a rerun of each mix_UZrC_graphite variant.
+
+The k-eff derivative assumes the leakage doesn't change to first order
+(openmc can't differentiate leakage), so a finite difference mode reruns
+the model at +/- a density step to check it.
+"""
+
+import argparse
+import json
+import os
+
+import h5py
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+def derivatives(fuel, nuclides=('U235',)):
+    """
+    returns {label: TallyDerivative} for the fuel density and the density of
+    each nuclide in the fuel
+    """
+    result = {'density': openmc.TallyDerivative(variable='density',
+                                                material=fuel.id)}
+    for nuclide in nuclides:
+        result[nuclide] = openmc.TallyDerivative(variable='nuclide_density',
+                                                 material=fuel.id,
+                                                 nuclide=nuclide)
+    return result
+
+
+def add_derivative_tallies(model, graphite_fuel, nuclides=('U235',)):
+    """
+    appends the base and derivative tallies to model.tallies, returns the
+    derivative labels
+    """
+    fuel = gd.get_material(model.materials, graphite_fuel)
+    fuel_cell_filter = openmc.DistribcellFilter(gd.get_cell(model.geometry,
+                                                            'fuel_element'))
+    fuel_filter = openmc.MaterialFilter([fuel])
+
+    def tallies(suffix, derivative=None):
+        loss = openmc.Tally(name=f'Sensitivity Balance{suffix}')
+        loss.scores = ['nu-fission', 'absorption']
+
+        heating = openmc.Tally(name=f'Sensitivity Heating{suffix}')
+        heating.filters = [fuel_cell_filter]
+        heating.scores = ['kappa-fission']
+
+        flux = openmc.Tally(name=f'Sensitivity Flux{suffix}')
+        flux.filters = [fuel_cell_filter, fuel_filter]
+        flux.scores = ['flux']
+
+        for tally in (loss, heating, flux):
+            tally.derivative = derivative
+        return [loss, heating, flux]
+
+    model.tallies.extend(tallies(''))
+    labels = derivatives(fuel, nuclides)
+    for label, derivative in labels.items():
+        model.tallies.extend(tallies(f' d/d {label}', derivative))
+
+    return list(labels)
+
+
+def read_sensitivities(statepoint, labels):
+    """
+    returns k-eff, per element power fraction, and for every label dk/dx
+    and the per element d(power fraction)/dx and d(flux)/dx, x being the
+    fuel density in g/cm3 or the nuclide density in atom/b-cm
+    """
+    with h5py.File(statepoint, 'r') as f:
+        keff = f['k_combined'][()]
+
+        def balance(suffix):
+            nu_fission, absorption = pp.tally_group(
+                f, f'Sensitivity Balance{suffix}')['results'][()][..., 0].ravel()[:2]
+            n = pp.tally_group(f, f'Sensitivity Balance{suffix}')['n_realizations'][()]
+            return nu_fission/n, absorption/n
+
+        nu_fission, absorption = balance('')
+        heating = pp.reduce_tally(f, 'Sensitivity Heating')['mean']
+        total = heating.sum()
+
+        result = {'keff': keff.tolist(), 'power_fraction': heating/total}
+        for label in labels:
+            suffix = f' d/d {label}'
+            d_nu_fission, d_absorption = balance(suffix)
+            # k = nu-fission/(absorption + leakage), leakage held fixed
+            loss = nu_fission/keff[0]
+            result[f'dk/d {label}'] = float((d_nu_fission - keff[0]*d_absorption)/loss)
+
+            d_heating = pp.reduce_tally(f, f'Sensitivity Heating{suffix}')['mean']
+            # power renormalized to the same total
+            result[f'dpower/d {label}'] = (d_heating - heating/total*d_heating.sum())/total
+            result[f'dflux/d {label}'] = pp.reduce_tally(f, f'Sensitivity Flux{suffix}')['mean']
+
+    return result
+
+
+def finite_difference(height, clocking, graphite_fuel, step=0.01,
+                      directory='sensitivity_fd', particles=200_000,
+                      batches=60, inactive=20, model_kwargs=None):
+    """
+    central difference dk/drho from runs at (1 +/- step) times the fuel
+    density, returns (dk/drho, std dev)
+    """
+    keffs = []
+    for sign in (1, -1):
+        model = gd.get_model(height, clocking, graphite_fuel, **(model_kwargs or {}))
+        model.settings.particles = particles
+        model.settings.batches = batches
+        model.settings.inactive = inactive
+        model.settings.temperature = {'default': 2500}
+
+        # the model's own copy of the fuel, the builder's material and
+        # other models keep the nominal density
+        fuel = gd.get_material(model.materials, graphite_fuel)
+        density, units = fuel.density, fuel.density_units
+        fuel.set_density(units, density*(1 + sign*step))
+
+        run_directory = os.path.join(directory, 'plus' if sign > 0 else 'minus')
+        os.makedirs(run_directory, exist_ok=True)
+        statepoint = model.run(cwd=run_directory)
+
+        with openmc.StatePoint(statepoint) as sp:
+            keffs.append((sp.keff.nominal_value, sp.keff.std_dev))
+
+    (k_plus, s_plus), (k_minus, s_minus) = keffs
+    d_rho = 2*step*density
+    return (k_plus - k_minus)/d_rho, np.hypot(s_plus, s_minus)/d_rho
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--nuclides', nargs='*', default=['U235'])
+    parser.add_argument('--particles', type=int, default=200_000)
+    parser.add_argument('--validate', action='store_true',
+                        help='check dk/drho against a finite difference')
+    args = parser.parse_args()
+
+    model = gd.get_model(args.height, args.clocking, args.fuel)
+    model.settings.particles = args.particles
+    model.settings.batches = 60
+    model.settings.inactive = 20
+    model.settings.temperature = {'default': 2500}
+    labels = add_derivative_tallies(model, args.fuel, args.nuclides)
+
+    os.makedirs('sensitivity', exist_ok=True)
+    statepoint = model.run(cwd='sensitivity')
+    result = read_sensitivities(statepoint, labels)
+
+    for label in labels:
+        dpower = result[f'dpower/d {label}']
+        print(f"dk/d {label}: {result[f'dk/d {label}']:.5e}, per element "
+              f'd(power fraction)/d {label} from {dpower.min():.3e} to {dpower.max():.3e}')
+
+    summary = {key: value for key, value in result.items() if np.ndim(value) < 2}
+    if args.validate:
+        fd, fd_std = finite_difference(args.height, args.clocking, args.fuel,
+                                       particles=args.particles)
+        print(f"finite difference dk/d density: {fd:.5e} +/- {fd_std:.5e}, "
+              f"derivative tally {result['dk/d density']:.5e}")
+        summary['fd_dk_d_density'] = [fd, fd_std]
+
+    with open('sensitivity.json', 'w') as f:
+        json.dump({k: np.asarray(v).tolist() for k, v in summary.items()}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
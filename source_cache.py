@@ -0,0 +1,233 @@
+"""
+Warm-start fission source cache for parameter sweeps.
+
+The converged source bank of every run is stored in a cache directory with
+the run's height, drum clocking and fuel, and a hash of the geometry
+variant (get_model keyword arguments and the geometry_definitions.py
+source). A new run is seeded from the nearest cached source of the same
+geometry variant instead of get_model's fission source, with the axial
+coordinates stretched to the new height, and runs fewer inactive batches:
+as many as the cached run needed to converge its Shannon entropy, scaled
+by how far the parameters moved. After the run the entropy is checked
+again and a warning is printed if it converged after the inactive batches.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import h5py
+import numpy as np
+import openmc
+
+import convergence_tracking as ct
+import geometry_definitions as gd
+
+
+# parameter changes that count as a completely different source
+height_scale = 20 #cm
+clocking_scale = 90 #degrees
+
+
+def geometry_hash(model_kwargs=None):
+    """
+    returns a hash of the geometry variant: the get_model keyword arguments
+    other than the fuel and the geometry_definitions.py source, so a cached
+    source is never used on a geometry built by different code. Callables,
+    e.g. temperature profiles, are hashed by their source and closure values
+    """
+    kwargs = {k: v for k, v in (model_kwargs or {}).items() if k != 'graphite_fuel'}
+
+    def encode(value):
+        if callable(value):
+            closure = [c.cell_contents for c in getattr(value, '__closure__', None) or ()]
+            return [inspect.getsource(value), closure]
+        raise TypeError(f'cannot hash get_model argument {value!r} of type '
+                        f'{type(value).__name__}, use names and numbers')
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(kwargs, sort_keys=True, default=encode).encode())
+    with open(gd.__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def load_index(cache_dir):
+    path = os.path.join(cache_dir, 'index.json')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(index, cache_dir):
+    with open(os.path.join(cache_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+
+def distance(entry, height, clocking, graphite_fuel):
+    """
+    distance between a cached run and the requested parameters, 1 is about
+    as different as starting from scratch
+    """
+    d_height = abs(entry['height'] - height)/height_scale
+    d_clocking = np.mean(np.abs(gd.drum_clockings(entry['clocking'])
+                                - gd.drum_clockings(clocking)))/clocking_scale
+    d_fuel = 0 if entry['graphite_fuel'] == graphite_fuel else 0.5
+    return d_height + d_clocking + d_fuel
+
+
+def nearest_source(index, height, clocking, graphite_fuel, geom_hash):
+    """
+    returns the nearest cached entry with the same geometry hash and its
+    distance, or (None, None)
+    """
+    candidates = [e for e in index if e['geometry_hash'] == geom_hash]
+    if not candidates:
+        return None, None
+
+    distances = [distance(e, height, clocking, graphite_fuel) for e in candidates]
+    i = int(np.argmin(distances))
+    return candidates[i], distances[i]
+
+
+def choose_inactive(entry, dist, full_inactive, min_inactive=3):
+    """
+    inactive batches for a run seeded from entry: the batches the cached run
+    needed to converge from its own start, scaled by the distance
+    """
+    needed = entry.get('converged_batch') or full_inactive
+    inactive = min_inactive + int(np.ceil(dist*needed))
+    return int(np.clip(inactive, min_inactive, full_inactive))
+
+
+def rescale_source(source_file, path, old_height, new_height):
+    """
+    writes a copy of source_file to path with z stretched from old_height to
+    new_height, so every site stays inside the core
+    """
+    shutil.copyfile(source_file, path)
+    if old_height == new_height:
+        return
+
+    with h5py.File(path, 'r+') as f:
+        bank = f['source_bank'][()]
+        bank['r']['z'] *= new_height/old_height
+        f['source_bank'][...] = bank
+
+
+def seed_model(model, height, clocking, graphite_fuel, directory,
+               cache_dir='source_cache', model_kwargs=None, min_inactive=3):
+    """
+    replaces the model source by the nearest cached source (copied into
+    directory) and lowers model.settings.inactive, returns the cached entry
+    and its distance, or (None, None) if nothing was cached for this geometry
+    """
+    entry, dist = nearest_source(load_index(cache_dir), height, clocking,
+                                 graphite_fuel, geometry_hash(model_kwargs))
+    if entry is None:
+        return None, None
+
+    os.makedirs(directory, exist_ok=True)
+    seed = os.path.join(directory, 'seed_source.h5')
+    rescale_source(os.path.join(cache_dir, entry['source']), seed,
+                   entry['height'], height)
+
+    model.settings.source = openmc.FileSource(os.path.abspath(seed))
+    model.settings.inactive = choose_inactive(entry, dist, model.settings.inactive,
+                                              min_inactive)
+    return entry, dist
+
+
+def store_source(statepoint, height, clocking, graphite_fuel,
+                 cache_dir='source_cache', model_kwargs=None,
+                 converged_batch=None):
+    """
+    copies the source bank written next to statepoint into the cache and
+    indexes it, with the batch its entropy converged at from the Box source.
+    converged_batch: pass the seed's value for seeded runs, their own
+    entropy only shows how far the seed was off
+    """
+    source_file = os.path.join(os.path.dirname(statepoint),
+                               os.path.basename(statepoint).replace('statepoint', 'source'))
+
+    with h5py.File(statepoint, 'r') as f:
+        entropy = f['entropy'][()] if 'entropy' in f else []
+        n_particles = int(f['n_particles'][()])
+
+    geom_hash = geometry_hash(model_kwargs)
+    clockings = gd.drum_clockings(clocking)
+    key = hashlib.sha256(json.dumps([height, clockings.tolist(), graphite_fuel,
+                                     geom_hash]).encode()).hexdigest()[:16]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    shutil.copyfile(source_file, os.path.join(cache_dir, f'{key}.h5'))
+
+    index = [e for e in load_index(cache_dir) if e['key'] != key]
+    index.append({'key': key, 'source': f'{key}.h5', 'height': height,
+                  'clocking': clockings.tolist(), 'graphite_fuel': graphite_fuel,
+                  'geometry_hash': geom_hash, 'n_particles': n_particles,
+                  'converged_batch': (converged_batch if converged_batch is not None
+                                      else ct.entropy_converged_batch(entropy))})
+    save_index(index, cache_dir)
+
+
+def run_cached(height, clocking, graphite_fuel='graphite_fuel_435U_30C',
+               directory='run', particles=1_000_000, batches=50, inactive=20,
+               cache_dir='source_cache', threads=None, model_kwargs=None):
+    """
+    runs get_model seeded from the source cache and stores its converged
+    source, returns the statepoint path and the inactive batches used
+    """
+    model_kwargs = dict(model_kwargs or {})
+    model = gd.get_model(height, clocking, graphite_fuel, **model_kwargs)
+
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': 2500}
+    model.settings.sourcepoint = {'batches': [batches], 'separate': True}
+
+    entry, dist = seed_model(model, height, clocking, graphite_fuel, directory,
+                             cache_dir, model_kwargs)
+    if entry is None:
+        print(f'no cached source, {inactive} inactive batches')
+    else:
+        print(f"seeded from height {entry['height']}, fuel "
+              f"{entry['graphite_fuel']} (distance {dist:.3f}), "
+              f'{model.settings.inactive} inactive batches')
+
+    os.makedirs(directory, exist_ok=True)
+    statepoint = model.run(cwd=directory, threads=threads)
+
+    with h5py.File(statepoint, 'r') as f:
+        entropy = f['entropy'][()] if 'entropy' in f else []
+    converged = ct.entropy_converged_batch(entropy)
+    if converged is not None and converged > model.settings.inactive:
+        print(f'WARNING: entropy converged at batch {converged}, after the '
+              f'{model.settings.inactive} inactive batches')
+
+    store_source(statepoint, height, clocking, graphite_fuel, cache_dir,
+                 model_kwargs, entry['converged_batch'] if entry else None)
+
+    return statepoint, model.settings.inactive
+
+
+def main():
+    core_height = 89
+    fuel_name = 'graphite_fuel_435U_30C'
+
+    # a small drum sweep, every run after the first starts from its neighbor
+    for angle in np.linspace(100, 120, 5):
+        statepoint, inactive = run_cached(core_height, angle, fuel_name,
+                                          directory=f'source_cache_run_{angle:g}')
+        with openmc.StatePoint(statepoint) as sp:
+            keff = sp.keff
+        print(f'drum angle {angle:g}: k-eff {keff.nominal_value:.5f} +/- '
+              f'{keff.std_dev:.5f} with {inactive} inactive batches')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Unfolds fuel element results from a symmetry reduced model
+(get_model(..., symmetry='sixth' or 'twelfth')) back onto the full core.
+
+The reduced models keep the whole core lattice and only cut it with the
+wedge planes, so their distribcell tallies already use the full core
+indexing, but only elements inside the wedge score. Each full core element
+is the average of the tallies of its images under the symmetry operations
+that tile the core from the wedge; elements cut by a wedge plane are put
+back together the same way.
+"""
+
+import numpy as np
+
+import geometry_definitions as gd
+
+
+def element_centers(geometry, cell_name='fuel_element'):
+    """
+    returns the (x, y, z) center of the core lattice element holding each
+    distribcell instance of the named cell, in instance order
+    """
+    centers = []
+    # the first lattice in each path is the core lattice
+    for lattice, idx in gd.instance_indices(geometry, cell_name):
+        # position of the origin relative to the element center
+        local = lattice.get_local_position((0., 0., 0.), idx)
+        centers.append(-np.asarray(local, dtype=float))
+
+    return np.array(centers)
+
+
+def symmetry_operations(symmetry):
+    """
+    returns the 2x2 matrices that map the wedge onto the rest of the core:
+    6 rotations for 'sixth', plus 6 reflections for 'twelfth'
+    """
+    rotations = []
+    for angle in np.deg2rad(np.arange(0, 360, 60)):
+        c, s = np.cos(angle), np.sin(angle)
+        rotations.append(np.array([[c, -s], [s, c]]))
+
+    if symmetry == 'sixth':
+        return rotations
+    elif symmetry == 'twelfth':
+        mirror = np.diag([1., -1.])
+        return rotations + [rotation @ mirror for rotation in rotations]
+
+    raise ValueError(f'unknown symmetry {symmetry}')
+
+
+def image_indices(centers, symmetry, tolerance=1e-6):
+    """
+    returns an (operations, instances) array, entry [g, i] is the instance
+    whose element is the image of instance i under operation g
+    """
+    centers = np.asarray(centers)
+    images = []
+    for operation in symmetry_operations(symmetry):
+        moved = centers.copy()
+        moved[:, :2] = centers[:, :2] @ operation.T
+
+        distance = np.linalg.norm(moved[:, None, :] - centers[None, :, :], axis=2)
+        nearest = distance.argmin(axis=1)
+        if np.any(distance[np.arange(len(centers)), nearest] > tolerance):
+            raise ValueError(f'core lattice is not {symmetry} symmetric')
+        images.append(nearest)
+
+    return np.array(images)
+
+
+def unfold(mean, std_dev, centers, symmetry):
+    """
+    mean, std_dev: arrays with distribcell instances along the first axis
+    (e.g. the reshaped fuel heating or flux tally of a reduced model)
+
+    returns: full core mean and std_dev with the same shape, on the same
+    per source particle normalization as a full core run. Different images
+    are independent tally bins, but an element on a mirror plane or at the
+    center is its own image under several operations, those copies are the
+    same bin and add fully correlated
+    """
+    if symmetry == 'full':
+        return np.asarray(mean), np.asarray(std_dev)
+
+    images = image_indices(centers, symmetry)
+    n_operations = images.shape[0]
+
+    mean = np.asarray(mean)
+    std_dev = np.asarray(std_dev, dtype=float)
+    full_mean = mean[images].sum(axis=0)/n_operations
+
+    full_std_dev = np.empty_like(std_dev)
+    for i in range(images.shape[1]):
+        bins, counts = np.unique(images[:, i], return_counts=True)
+        counts = counts.reshape((-1,) + (1,)*(std_dev.ndim - 1))
+        full_std_dev[i] = np.sqrt(((counts*std_dev[bins])**2).sum(axis=0))/n_operations
+
+    return full_mean, full_std_dev
+
+
+def unfold_tally(tally, geometry, symmetry, cell_name='fuel_element'):
+    """
+    unfolds a statepoint tally whose first filter is the distribcell filter
+    on cell_name, returns full core mean and std_dev from
+    get_reshaped_data, like the post processing notebook uses
+    """
+    centers = element_centers(geometry, cell_name)
+    return unfold(tally.get_reshaped_data('mean'),
+                  tally.get_reshaped_data('std_dev'), centers, symmetry)
@@ -0,0 +1,162 @@
+"""
+Memory cost of per region temperatures.
+
+Builds the core with radial and axial temperature profiles on the fuel
+elements, tie tubes and beryllium elements (one temperature per distribcell
+instance, see get_model(..., temperatures=...)) and estimates how much
+nuclear data openmc loads for them from the HDF5 library sizes: loading
+the nearest library temperature for every distinct temperature, against
+interpolation or windowed multipole where only the library temperatures
+spanning the range are loaded. With --run the openmc memory high-water
+mark of a short run is measured as well.
+"""
+
+import argparse
+import os
+
+import h5py
+import numpy as np
+import openmc
+import openmc.data
+
+import benchmark
+import geometry_definitions as gd
+
+
+def example_temperatures(height, axial_peak=2800, inlet=400):
+    """
+    temperature profiles for the core: fuel hottest at the core center and
+    the outlet end, moderator and beryllium much cooler
+    """
+    core_radius = 29.5275
+
+    def fuel(x, y, z):
+        r = np.hypot(x, y)/core_radius
+        axial = 0.5*(1 + z/(height/2))  # 0 at the inlet, 1 at the outlet
+        return inlet + (axial_peak - inlet)*(0.6 + 0.4*axial)*(1 - 0.3*r**2)
+
+    def tie_tube(x, y, z):
+        return 0.5*fuel(x, y, z)
+
+    return {'default': 600, 'fuel_assembly': fuel, 'tie_tube': tie_tube,
+            'zirconium_hydride_II': 700, 'beryllium_assembly': 500,
+            'Beryllium': 400}
+
+
+def temperature_sizes(path, name):
+    """
+    returns {library temperature: bytes} of the temperature dependent data
+    of one nuclide file and the bytes of the rest
+    """
+    sizes = {}
+    other = 0
+
+    def visit(key, item):
+        nonlocal other
+        if not isinstance(item, h5py.Dataset):
+            return
+        labels = [part for part in key.split('/') if part.endswith('K')
+                  and part[:-1].isdigit()]
+        if labels:
+            T = int(labels[0][:-1])
+            sizes[T] = sizes.get(T, 0) + item.nbytes
+        else:
+            other += item.nbytes
+
+    with h5py.File(path, 'r') as f:
+        f[name].visititems(visit)
+
+    return sizes, other
+
+
+def loaded_temperatures(available, requested, method):
+    """
+    library temperatures openmc loads for the requested ones: the nearest
+    one for each with 'nearest', every one bracketing the requested range
+    for 'interpolation' and 'multipole'
+    """
+    available = np.sort(np.asarray(available))
+    requested = np.asarray(requested)
+
+    if method == 'nearest':
+        nearest = np.abs(available[:, None] - requested[None, :]).argmin(axis=0)
+        return set(available[np.unique(nearest)].tolist())
+
+    low = available[available <= requested.min()]
+    high = available[available >= requested.max()]
+    lower = low.max() if low.size else available.min()
+    upper = high.min() if high.size else available.max()
+    return set(available[(available >= lower) & (available <= upper)].tolist())
+
+
+def estimate_memory(model, temperatures_used, methods=('nearest', 'interpolation',
+                                                       'multipole')):
+    """
+    returns {method: MB} of neutron data loaded for every nuclide in the
+    model at the distinct temperatures_used
+    """
+    library = openmc.data.DataLibrary.from_xml(openmc.config['cross_sections'])
+    paths = {}
+    for entry in library.libraries:
+        for name in entry['materials']:
+            paths[(entry['type'], name)] = entry['path']
+
+    nuclides = {n for material in model.geometry.get_all_materials().values()
+                for n in material.get_nuclides()}
+
+    totals = dict.fromkeys(methods, 0.)
+    for nuclide in sorted(nuclides):
+        path = paths.get(('neutron', nuclide))
+        if path is None:
+            continue
+        sizes, other = temperature_sizes(path, nuclide)
+        for method in methods:
+            loaded = loaded_temperatures(list(sizes), temperatures_used,
+                                         'nearest' if method == 'nearest'
+                                         else 'interpolation')
+            totals[method] += other + sum(sizes[T] for T in loaded)
+
+            wmp = paths.get(('wmp', nuclide))
+            if method == 'multipole' and wmp is not None:
+                totals[method] += os.path.getsize(wmp)
+
+    return {method: total/1024**2 for method, total in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--axial-layers', type=int, default=10)
+    parser.add_argument('--doppler', default='interpolation',
+                        choices=['interpolation', 'multipole', 'nearest'])
+    parser.add_argument('--run', action='store_true',
+                        help='also measure the memory of a short run')
+    args = parser.parse_args()
+
+    temperatures = example_temperatures(args.height)
+    model = gd.get_model(args.height, args.clocking,
+                         axial_layers=args.axial_layers,
+                         temperatures=temperatures, doppler=args.doppler)
+
+    used = set()
+    for cell in model.geometry.get_all_cells().values():
+        if cell.temperature is not None:
+            used.update(np.atleast_1d(cell.temperature).tolist())
+    used.add(temperatures['default'])
+
+    print(f'{len(used)} distinct temperatures from {min(used):.0f} K to '
+          f'{max(used):.0f} K, settings.temperature = {model.settings.temperature}')
+
+    for method, mb in estimate_memory(model, sorted(used)).items():
+        print(f'{method:>14}: {mb:10.1f} MB of neutron data')
+
+    if args.run:
+        result = benchmark.measure(model, 'temperature_memory', particles=10_000,
+                                   batches=4, inactive=2)
+        print(f"measured openmc high-water mark {result['maxrss_mb']:.1f} MB, "
+              f"{result['active_pps']:.1f} particles/s active")
+
+
+if __name__ == '__main__':
+    main()
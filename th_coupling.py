@@ -0,0 +1,247 @@
+"""
+Neutronics / propellant thermal hydraulics coupling in memory.
+
+The core lattice is stacked in axial layers (get_model(...,
+axial_layers=n)) and the hydrogen in the fuel element channels gets one
+material per layer, so every fuel element and layer has its own fuel and
+propellant temperature (distribcell instance temperatures) and every layer
+its own hydrogen density. OpenMC is initialized once with openmc.lib; each
+Picard iteration runs the transport, turns the kappa-fission distribcell
+tally into element by layer power, solves a 1D energy balance down every
+fuel element channel, and sets the new temperatures and densities in
+memory, without writing XML or reinitializing.
+
+The channel model: the hydrogen heats up by the power of each layer
+(constant cp), the fuel is hotter than the layer's mean propellant
+temperature by the film drop q/(h A) over the wetted channel area, and the
+hydrogen density follows the ideal gas law at the chamber pressure. The
+tie tube hydrogen keeps the 'Hydrogen STP' material.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import openmc
+import openmc.lib
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+hydrogen_molar_mass = 2.016e-3 # kg/mol
+gas_constant = 8.314 # J/mol-K
+
+# wetted perimeter of the 19 channels in each fuel element
+channel_perimeter = 19*np.pi*gd.channel_diameter/100 # m
+
+
+def channel_balance(power_map, mass_flow, inlet=560., cp=15_000., h=50_000.,
+                    height=89., pressure=6.9e6, flow='down', orificing='uniform'):
+    """
+    power_map: (elements, layers) watts, layer 0 at the bottom
+    mass_flow: total hydrogen flow through the fuel elements, kg/s
+    flow: 'down' enters at the top layer, 'up' at the bottom
+    orificing: 'uniform' flow per element, or 'power' flow proportional to
+    element power (equal outlet temperatures)
+
+    returns the (elements, layers) mean propellant and fuel temperatures in
+    K and the per layer hydrogen density in g/cm3
+    """
+    q = power_map[:, ::-1] if flow == 'down' else power_map
+    element_power = q.sum(axis=1)
+    if orificing == 'power':
+        flow_rate = mass_flow*element_power/element_power.sum()
+    elif orificing == 'uniform':
+        flow_rate = np.full(len(q), mass_flow/len(q))
+    else:
+        raise ValueError(f'unknown orificing {orificing}')
+
+    heat_capacity = flow_rate[:, None]*cp
+    outlet = inlet + np.cumsum(q, axis=1)/heat_capacity
+    propellant = outlet - 0.5*q/heat_capacity
+
+    wetted_area = channel_perimeter*height/100/q.shape[1]
+    fuel = propellant + q/(h*wetted_area)
+
+    if flow == 'down':
+        propellant, fuel = propellant[:, ::-1], fuel[:, ::-1]
+
+    density = pressure*hydrogen_molar_mass/(gas_constant*propellant)/1000
+    return propellant, fuel, density.mean(axis=0)
+
+
+def layer_hydrogen(model, index, name='Hydrogen STP'):
+    """
+    fills the fuel element channels with one hydrogen material per axial
+    layer (a distributed fill over the channel instances), returns the
+    channel cell and the layer materials
+    """
+    assembly = next(u for u in model.geometry.get_all_universes().values()
+                    if u.name == 'fuel_assembly')
+    channel = next((c for c in assembly.cells.values()
+                    if c.fill_type == 'material' and c.fill.name == name), None)
+    if channel is None:
+        raise ValueError(f'no {name} cell in the fuel assembly, layered '
+                         f'hydrogen needs fuel_mode union')
+
+    hydrogen = gd.get_material(model.materials, name)
+    n_layers = index['layer'].max() + 1
+    layers = []
+    for layer in range(n_layers):
+        material = hydrogen.clone()
+        material.name = f'{name} layer {layer}'
+        layers.append(material)
+    model.materials.extend(layers)
+
+    channel.fill = [layers[layer] for layer in index['layer']]
+    return channel, layers
+
+
+def setup_model(height, clocking, graphite_fuel, axial_layers, particles,
+                batches, inactive, temperature_range=(300., 3200.)):
+    """
+    returns the layered model with the element power tally, the distribcell
+    index, and the fuel and channel cells and hydrogen layer materials set
+    in memory during the iterations
+    """
+    model = gd.get_model(height, clocking, graphite_fuel,
+                         axial_layers=axial_layers)
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = gd.doppler_settings(temperature_range)
+
+    model.tallies = [openmc.Tally(name='Heating')]
+    model.tallies[0].filters = [openmc.DistribcellFilter(
+        gd.get_cell(model.geometry, 'fuel_element'))]
+    model.tallies[0].scores = ['kappa-fission']
+
+    index = gd.get_model_builder().distribcell_index(graphite_fuel, 'union',
+                                                     axial_layers, height)
+    channel, layers = layer_hydrogen(model, index)
+    return model, index, channel, layers
+
+
+def couple(height=89., clocking=180 - 70.277, graphite_fuel='graphite_fuel_435U_30C',
+           axial_layers=10, power=pp.thermal_power, mass_flow=12.5, inlet=560.,
+           iterations=6, relaxation=0.7, tolerance=10., particles=100_000,
+           batches=60, inactive=20, directory='th_coupling', threads=None,
+           channel_kwargs=None):
+    """
+    Picard iterations between openmc.lib and channel_balance, stopping when
+    no fuel temperature moves more than tolerance K. relaxation weights the
+    new temperatures against the previous iteration
+
+    returns the final fields and the per iteration history
+    """
+    temperature_range = (min(inlet, 300.), 3200.)
+    model, index, channel, layers = setup_model(
+        height, clocking, graphite_fuel, axial_layers, particles, batches,
+        inactive, temperature_range)
+
+    os.makedirs(directory, exist_ok=True)
+    model.export_to_model_xml(directory)
+
+    fuel_cell = gd.get_cell(model.geometry, 'fuel_element')
+    tally_id = model.tallies[0].id
+    channel_kwargs = dict(channel_kwargs or {}, height=height)
+
+    elements = sorted(set(zip(index['ring'], index['position'])))
+    row = {element: n for n, element in enumerate(elements)}
+    rows = np.array([row[e] for e in zip(index['ring'], index['position'])])
+    layer = index['layer']
+    shape = (len(elements), axial_layers)
+
+    def apply(propellant, fuel, density):
+        fuel_lib = openmc.lib.cells[fuel_cell.id]
+        channel_lib = openmc.lib.cells[channel.id]
+        fuel_t = np.clip(fuel[rows, layer], *temperature_range)
+        channel_t = np.clip(propellant[rows, layer], *temperature_range)
+        for instance, (t_fuel, t_channel) in enumerate(zip(fuel_t, channel_t)):
+            fuel_lib.set_temperature(t_fuel, instance)
+            channel_lib.set_temperature(t_channel, instance)
+        for material, rho in zip(layers, density):
+            openmc.lib.materials[material.id].set_density(rho, 'g/cm3')
+
+    # start from a flat power shape
+    power_map = np.full(shape, power/np.prod(shape))
+    propellant, fuel, density = channel_balance(power_map, mass_flow, inlet,
+                                                **channel_kwargs)
+
+    history = []
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        args = ['-s', str(threads)] if threads else None
+        with openmc.lib.run_in_memory(args=args):
+            for iteration in range(iterations):
+                apply(propellant, fuel, density)
+                openmc.lib.reset()
+                openmc.lib.run(output=False)
+                keff = openmc.lib.keff()
+
+                heating = openmc.lib.tallies[tally_id].mean.ravel()
+                power_map = np.zeros(shape)
+                power_map[rows, layer] = heating/heating.sum()*power
+
+                new_propellant, new_fuel, new_density = channel_balance(
+                    power_map, mass_flow, inlet, **channel_kwargs)
+                change = float(np.abs(new_fuel - fuel).max())
+
+                propellant = relaxation*new_propellant + (1 - relaxation)*propellant
+                fuel = relaxation*new_fuel + (1 - relaxation)*fuel
+                density = relaxation*new_density + (1 - relaxation)*density
+
+                history.append({'iteration': iteration, 'keff': list(keff),
+                                'max_fuel_change': change,
+                                'max_fuel': float(fuel.max()),
+                                'max_propellant': float(propellant.max())})
+                print(f'iteration {iteration}: k-eff {keff[0]:.5f} +/- {keff[1]:.5f}, '
+                      f'max fuel {fuel.max():.0f} K, fuel change {change:.1f} K')
+                if change < tolerance:
+                    break
+    finally:
+        os.chdir(cwd)
+
+    fields = {'power_map': power_map, 'propellant': propellant, 'fuel': fuel,
+              'density': density, 'elements': np.array(elements)}
+    return fields, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277)
+    parser.add_argument('--fuel', default='graphite_fuel_435U_30C')
+    parser.add_argument('--layers', type=int, default=10)
+    parser.add_argument('--power', type=float, default=pp.thermal_power)
+    parser.add_argument('--mass-flow', type=float, default=12.5,
+                        help='hydrogen flow through the fuel elements, kg/s')
+    parser.add_argument('--inlet', type=float, default=560.,
+                        help='fuel element inlet temperature, K')
+    parser.add_argument('--orificing', choices=['uniform', 'power'], default='uniform')
+    parser.add_argument('--iterations', type=int, default=6)
+    parser.add_argument('--particles', type=int, default=100_000)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--directory', default='th_coupling')
+    args = parser.parse_args()
+
+    fields, history = couple(args.height, args.clocking, args.fuel, args.layers,
+                             args.power, args.mass_flow, args.inlet,
+                             args.iterations, particles=args.particles,
+                             directory=args.directory, threads=args.threads,
+                             channel_kwargs={'orificing': args.orificing})
+
+    print(f"peak propellant {fields['propellant'].max():.0f} K, peak fuel "
+          f"{fields['fuel'].max():.0f} K, hydrogen density "
+          f"{fields['density'].min():.3e} to {fields['density'].max():.3e} g/cm3")
+
+    np.savez_compressed(os.path.join(args.directory, 'th_fields.npz'), **fields)
+    with open(os.path.join(args.directory, 'th_history.json'), 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Weight window generation for the ex-core drum and axial flux tallies.
+
+Weight windows are generated with iterated MAGIC on a cylindrical r-z mesh
+over the whole full_core() geometry: each iteration runs with the windows
+from the previous one and lets openmc's WeightWindowGenerator update them.
+The mesh has no azimuthal detail by default, so the windows don't depend
+on the drum clocking and one set is reused for every clocking of a sweep.
+The figure of merit (1/(R^2 T), R the worst bin relative error and T the
+active batch time) of the Axial Flux Tally and the drum and reflector
+tallies is compared to an analog run.
+"""
+
+import argparse
+import json
+import os
+
+import h5py
+import numpy as np
+import openmc
+
+import geometry_definitions as gd
+import post_processing as pp
+
+
+# Measurements from Schnitzler 2007, same as full_core
+inner_gap_inner_radius = 29.5275
+reflector_outer_radius = 33.6550 + 14.7
+
+# coarse groups for the windows: thermal, epithermal, fast
+ww_energy_bounds = [0.0, 0.625, 1e5, 20e6]
+
+tally_names = ('Axial Flux Tally', 'Drum Poison', 'Reflector Flux')
+
+
+def ww_mesh(height, n_r=30, n_phi=1, n_z=20):
+    """
+    cylindrical mesh over the core and reflector, n_phi = 1 keeps the
+    windows independent of the drum clocking
+    """
+    mesh = openmc.CylindricalMesh(
+        r_grid=np.linspace(0, reflector_outer_radius, n_r + 1),
+        phi_grid=np.linspace(0, 2*np.pi, n_phi + 1),
+        z_grid=np.linspace(-height/2, height/2, n_z + 1))
+    return mesh
+
+
+def drum_cells(geometry):
+    """
+    returns the drum poison cells and the reflector sector cells holding
+    them, one of each per drum with reflector_mode='sectors'. With 'union'
+    the 12 poisons are one cell and there are no sector cells
+    """
+    cells = geometry.get_all_cells().values()
+    poison = [c for c in cells
+              if c.fill_type == 'material' and c.fill.name == 'copper_boron']
+    sectors = [c for c in cells if c.fill_type == 'universe'
+               and any(p.id in c.fill.cells for p in poison)]
+    return poison, sectors
+
+
+def ex_core_tallies(model, height):
+    """
+    returns the axial flux tally of first_run_model.py and the drum poison
+    absorption and reflector flux tallies whose error the windows target
+    """
+    materials = model.geometry.get_all_materials().values()
+    beryllium = [m for m in materials if m.name == 'Beryllium']
+
+    energy_filter = openmc.EnergyFilter(ww_energy_bounds)
+    n_filter = openmc.ParticleFilter('neutron')
+
+    axial_mesh = openmc.CylindricalMesh(r_grid=[0, inner_gap_inner_radius],
+                                        z_grid=np.linspace(-height/2, height/2, 12),
+                                        phi_grid=[0, 2*np.pi])
+    axial_flux_tally = openmc.Tally(name='Axial Flux Tally')
+    axial_flux_tally.filters = [openmc.MeshFilter(axial_mesh), energy_filter, n_filter]
+    axial_flux_tally.scores = ['flux']
+
+    # one bin per drum from the drum cells themselves, azimuthal mesh bins
+    # would have to start at 15 degrees to line up with the drums
+    poison, sectors = drum_cells(model.geometry)
+    reflector_mesh = openmc.CylindricalMesh(r_grid=[33.6550, reflector_outer_radius],
+                                            phi_grid=[0, 2*np.pi],
+                                            z_grid=np.linspace(-height/2, height/2, 5))
+    reflector_mesh_filter = openmc.MeshFilter(reflector_mesh)
+
+    drum_tally = openmc.Tally(name='Drum Poison')
+    drum_tally.filters = [openmc.CellFilter(poison), reflector_mesh_filter]
+    drum_tally.scores = ['absorption']
+
+    reflector_tally = openmc.Tally(name='Reflector Flux')
+    reflector_tally.filters = ([openmc.CellFilter(sectors)] if sectors else []) + \
+        [reflector_mesh_filter, openmc.MaterialFilter(beryllium), energy_filter]
+    reflector_tally.scores = ['flux']
+
+    return [axial_flux_tally, drum_tally, reflector_tally]
+
+
+def setup_model(height, clocking, particles, batches, inactive,
+                model_kwargs=None):
+    model = gd.get_model(height, clocking, **(model_kwargs or {}))
+    model.settings.particles = particles
+    model.settings.batches = batches
+    model.settings.inactive = inactive
+    model.settings.temperature = {'default': 2500}
+    model.tallies = ex_core_tallies(model, height)
+    return model
+
+
+def use_weight_windows(model, ww_file):
+    """
+    turns on the weight windows stored in ww_file for model
+    """
+    model.settings.weight_windows = openmc.hdf5_to_wws(ww_file)
+    model.settings.weight_windows_on = True
+
+
+def generate(height, clocking, directory='weight_windows', iterations=3,
+             particles=100_000, batches=30, inactive=15, mesh_kwargs=None,
+             threads=None, model_kwargs=None):
+    """
+    iterated MAGIC: every iteration runs with the windows of the previous
+    one and regenerates them, returns the path of the last weight_windows.h5
+    """
+    mesh = ww_mesh(height, **(mesh_kwargs or {}))
+    ww_file = None
+
+    for iteration in range(iterations):
+        model = setup_model(height, clocking, particles, batches, inactive,
+                            model_kwargs)
+        model.settings.weight_window_generators = openmc.WeightWindowGenerator(
+            mesh, energy_bounds=ww_energy_bounds, particle_type='neutron',
+            method='magic', max_realizations=batches - inactive,
+            update_interval=1, on_the_fly=True)
+        if ww_file is not None:
+            use_weight_windows(model, ww_file)
+
+        run_directory = os.path.join(directory, f'iter{iteration}')
+        os.makedirs(run_directory, exist_ok=True)
+        model.run(cwd=run_directory, threads=threads)
+        ww_file = os.path.abspath(os.path.join(run_directory, 'weight_windows.h5'))
+
+        print(f'iteration {iteration}: weight windows in {ww_file}')
+
+    return ww_file
+
+
+def figures_of_merit(statepoint):
+    """
+    returns {tally name: (worst bin relative error, FOM)} using the active
+    batch time
+    """
+    with openmc.StatePoint(statepoint) as sp:
+        active_time = sp.runtime['active batches']
+
+    foms = {}
+    with h5py.File(statepoint, 'r') as f:
+        for name in tally_names:
+            rel_err = pp.reduce_tally(f, name)['overall_max_rel_err']
+            foms[name] = (float(rel_err), float(1/(rel_err**2*active_time)))
+
+    return foms
+
+
+def compare(height, clocking, ww_file, directory='weight_windows_compare',
+            particles=100_000, batches=30, inactive=15, threads=None,
+            model_kwargs=None):
+    """
+    runs the same model analog and with the weight windows, prints and
+    returns the FOM of each tally and the improvement
+    """
+    results = {}
+    for case in ('analog', 'weight_windows'):
+        model = setup_model(height, clocking, particles, batches, inactive,
+                            model_kwargs)
+        if case == 'weight_windows':
+            use_weight_windows(model, ww_file)
+
+        run_directory = os.path.join(directory, f'{clocking:g}_{case}')
+        os.makedirs(run_directory, exist_ok=True)
+        results[case] = figures_of_merit(model.run(cwd=run_directory,
+                                                   threads=threads))
+
+    improvement = {}
+    for name in tally_names:
+        analog_err, analog_fom = results['analog'][name]
+        ww_err, ww_fom = results['weight_windows'][name]
+        improvement[name] = ww_fom/analog_fom
+        print(f'{name:>18} clocking {clocking:g}: rel err {analog_err:.4f} -> '
+              f'{ww_err:.4f}, FOM {analog_fom:.3e} -> {ww_fom:.3e} '
+              f'(x{improvement[name]:.2f})')
+
+    return {'clocking': clocking, 'results': results, 'improvement': improvement}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--height', type=float, default=89)
+    parser.add_argument('--clocking', type=float, default=180 - 70.277,
+                        help='drum angle the windows are generated at')
+    parser.add_argument('--compare-clockings', nargs='*', type=float,
+                        default=[0, 180 - 70.277, 180],
+                        help='drum angles the windows are reused at')
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--particles', type=int, default=100_000)
+    args = parser.parse_args()
+
+    ww_file = generate(args.height, args.clocking, iterations=args.iterations,
+                       particles=args.particles)
+
+    comparisons = [compare(args.height, clocking, ww_file,
+                           particles=args.particles)
+                   for clocking in args.compare_clockings]
+
+    with open('weight_windows_fom.json', 'w') as f:
+        json.dump({'weight_windows': ww_file, 'comparisons': comparisons},
+                  f, indent=2)
+
+
+if __name__ == '__main__':
+    main()